@@ -4,7 +4,7 @@ import os
 
 # Numpy (https://numpy.org/)
 # and ctypes (https://docs.python.org/3/library/ctypes.html)
-from ctypes import c_float,cdll
+from ctypes import c_float,c_uint64,cdll
 
 # Matplotlib (https://matplotlib.org/) 
 # imports for plotting and animation
@@ -14,6 +14,8 @@ import matplotlib.animation as animation
 # === CONSTANTS ===
 position_velocity = [1.0,0.1]
 dt    = 0.05
+SEED  = 2025 # Seed of the random numbers in libsolver (same seed, same trajectory)
+step  = 0    # Number of the step, selects the random numbers of next_coordinate_1D
 
 # === C LIBRARY LOADING ===
 # Define the path to the compiled C library (.so file)
@@ -26,18 +28,23 @@ _libsolver    = cdll.LoadLibrary(__solver_path)
 # Get the functions from the loaded library
 next_coordinate_1D = _libsolver.next_coordinate_1D
 next_velocity_1D   = _libsolver.next_velocity_1D
+seed_1D            = _libsolver.seed_1D
 
 # Define the argument types (argtypes) for the C functions
 # This tells ctypes how to interpret the Python arguments.
 # The signature is:
-# (IN coord, IN vel, OUT new_(pos|vel), IN dt)
-next_coordinate_1D.argtypes = [c_float,c_float,c_float]
+# (IN coord, IN vel, OUT new_(pos|vel), IN dt[, IN particle, IN step])
+next_coordinate_1D.argtypes = [c_float,c_float,c_float,c_uint64,c_uint64]
 next_velocity_1D.argtypes   = [c_float,c_float,c_float]
 
 # Define the return types (restype) for the C functions
 next_coordinate_1D.restype  = c_float
 next_velocity_1D.restype    = c_float
 
+seed_1D.argtypes = [c_uint64]
+seed_1D.restype  = None
+seed_1D(SEED)
+
 # === PLOTTING SETUP ===
 fig, ax = plt.subplots()
 
@@ -52,12 +59,14 @@ def update_frame(frame):
     This function is called for each frame of the animation.
     It calculates the new state of the simulation and updates the plot.
     """
-    position_velocity[0] = next_coordinate_1D(*position_velocity,dt)
+    global step
+    position_velocity[0] = next_coordinate_1D(*position_velocity,dt,0,step)
     position_velocity[1] = next_velocity_1D(*position_velocity,dt)
 
     # --- Update Matplotlib elements ---
     # Update the positions of the scattered points
     points.set_offsets(position_velocity)
+    step += 1
 
 # === RUN ANIMATION ===
 # Create the animation object
@@ -1,17 +1,46 @@
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdint.h>
+
+// --- Random numbers ---
+
+/*
+ * Counter-based generator: every draw is the SplitMix64 hash of
+ * (seed, particle, step), with no state changed by a draw. The same seed
+ * gives the same numbers for every particle and step, whichever thread
+ * computes them and however many threads there are.
+ */
+static uint64_t rng_seed = 0x853c49e6748fea9bULL;
+
+void seed_1D(uint64_t seed){
+  /* Sets the seed; call it before the threads start drawing */
+  rng_seed = seed;
+}
+
+static inline uint64_t mix(uint64_t z){
+  z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9ULL;
+  z = (z ^ (z >> 27)) * 0x94d049bb133111ebULL;
+  return z ^ (z >> 31);
+}
+
+static inline uint64_t random_1D(uint64_t particle, uint64_t step){
+  /* Random 64 bits of draw `step` of `particle` */
+  uint64_t z = mix(rng_seed + 0x9e3779b97f4a7c15ULL * (particle + 1U));
+  return mix(z + 0x9e3779b97f4a7c15ULL * (step + 1U));
+}
 
 // --- 1D Functions ---
 
 /*
  * Calculates the next 1D coordinate 
+ * of the particle number `particle` in the step number `step`
  */
 
-float next_coordinate_1D(float coord, float vel, float dt){
+float next_coordinate_1D(float coord, float vel, float dt, uint64_t particle, uint64_t step){
   /* Calculating new coordinates */
 
   /* Example: randomize */
-  float ratio = dt*(rand()%10-4.5)/5.0;
+  float ratio = dt*((int)(random_1D(particle, step)%10)-4.5)/5.0;
   return coord += ratio;
 }
 
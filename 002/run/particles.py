@@ -7,7 +7,7 @@ from sys import argv
 # Numpy (https://numpy.org/)
 # and ctypes (https://docs.python.org/3/library/ctypes.html)
 import numpy as np 
-from ctypes import c_float, c_int, Structure, POINTER, byref, cdll
+from ctypes import c_float, c_size_t, Structure, POINTER, byref, cdll
 
 # Matplotlib (https://matplotlib.org/) 
 # imports for plotting and animation
@@ -90,9 +90,9 @@ c_vec1D_ptr = POINTER(c_float)  # Alias for pointer to Vector1D
 c_vec2D_ptr = POINTER(Vector2D) # Alias for pointer to Vector2D
 c_vec3D_ptr = POINTER(Vector3D) # Alias for pointer to Vector3D
 
-next_1D.argtypes = [c_vec1D_ptr, c_vec1D_ptr, c_vec1D_ptr, c_vec1D_ptr, c_float, c_int]
-next_2D.argtypes = [c_vec2D_ptr, c_vec2D_ptr, c_vec2D_ptr, c_vec2D_ptr, c_float, c_int]
-next_3D.argtypes = [c_vec3D_ptr, c_vec3D_ptr, c_vec3D_ptr, c_vec3D_ptr, c_float, c_int]
+next_1D.argtypes = [c_vec1D_ptr, c_vec1D_ptr, c_vec1D_ptr, c_vec1D_ptr, c_float, c_size_t]
+next_2D.argtypes = [c_vec2D_ptr, c_vec2D_ptr, c_vec2D_ptr, c_vec2D_ptr, c_float, c_size_t]
+next_3D.argtypes = [c_vec3D_ptr, c_vec3D_ptr, c_vec3D_ptr, c_vec3D_ptr, c_float, c_size_t]
 
 c_vec1D_arr = c_float *NUMBER_OF_PARTICLES # Alias for pointer to an array of Vector1D
 c_vec2D_arr = Vector2D*NUMBER_OF_PARTICLES # Alias for pointer to an array of Vector2D
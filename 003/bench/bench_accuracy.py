@@ -0,0 +1,326 @@
+"""
+Accuracy versus cost of the integrators: work-precision tables.
+
+The systems of lagrangian.py (and example_sympy.py) are compiled with
+LagrangianToC and integrated by EOMSolver for a sweep of time steps:
+ - pendulum: released at rest from THETA0 (a small angle), compared with the
+   exact solution (Jacobi elliptic functions, evaluated by mpmath),
+ - double_pendulum: compared with a float64 RK4 reference run with a much
+   smaller step (its own error is estimated by halving that step),
+ - decay: the built-in force of next_1D (dx/dt = -1e-3 x), compared with
+   x0 exp(-1e-3 t).
+Integrators: 'rk4' (EOMSolver.advance), 'verlet' (the Langevin integrator
+without friction and noise, i.e. velocity Verlet; only for accelerations
+independent of the velocities), and 'next_1D' (stepped from Python).
+For every (integrator, dt) the tables give the number of derivative
+evaluations, the wall time, the largest error of the coordinates at
+CHECKPOINTS times, the observed order of convergence, and the largest
+relative drift of the energy. The state is float32: once the truncation
+error falls below about 1e-6, round-off dominates and grows with the
+number of steps (negative orders), so smaller steps only cost more.
+
+    python3 bench_accuracy.py
+    python3 bench_accuracy.py --t-end 20 --dt 0.1 0.01 0.001 -o accuracy.json
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import argparse
+import contextlib
+import io
+import math
+import os
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+# Third party imports
+import numpy as np
+
+# Local imports
+from common import SOLVER_DIR, best_time, record
+import bench_codegen
+import cprototype as cp
+from ccompiler import CSharedLibraryCompiler
+
+# === CONSTANTS ===
+T_END       = 10.0
+TIME_STEPS  = [0.1, 0.05, 0.02, 0.01, 0.005, 0.002, 0.001]
+CHECKPOINTS = 20                      # errors and energies are compared at T_END*k/CHECKPOINTS
+TARGETS     = [1e-2, 1e-4, 1e-6]      # accuracy targets of the summary
+PARAMETERS  = dict(m=1.0, g=9.81, l=1.0, m1=1.0, m2=1.0, l1=1.0, l2=1.0)
+THETA0      = 0.1                     # initial angle of the pendulum
+DOUBLE0     = ([0.5, 0.3], [0.0, 0.0])  # initial state of the double pendulum
+DECAY       = 1e-3                    # dx/dt = -DECAY*x in solver.c
+REFERENCE_DT = 1e-4                   # step of the float64 reference run
+
+
+# === SYSTEMS ===
+def prepare(system: str) -> Dict:
+    """
+    Lagrangian of a system of bench_codegen with PARAMETERS substituted, and
+    float64 functions of (q, dq): accelerations, and energy sum(dq dL/d(dq)) - L.
+    """
+    import sympy as sp
+    from sympy.physics.mechanics import LagrangesMethod, dynamicsymbols
+
+    L, q = bench_codegen.SYSTEMS[system]()
+    L = L.subs({s: PARAMETERS[s.name] for s in L.free_symbols if s.name in PARAMETERS})
+    t = dynamicsymbols._t
+    qs, us = sp.symbols(f"q0:{len(q)}"), sp.symbols(f"u0:{len(q)}")
+    plain = lambda e: e.subs(dict(zip([qi.diff(t) for qi in q], us))).subs(dict(zip(q, qs)))
+
+    LM = LagrangesMethod(L, q)
+    LM.form_lagranges_equations()
+    accelerations = [plain(a) for a in LM.rhs()[len(q):, 0]]
+    energy = plain(sum(qi.diff(t) * L.diff(qi.diff(t)) for qi in q) - L)
+    return dict(name=system, L=L, q=q,
+                accelerations=sp.lambdify([qs, us], accelerations, "math"),
+                energy=sp.lambdify([qs, us], energy, "math"))
+
+
+def build_library(systems: List[Dict], output_dir: str) -> str:
+    """
+    Compile solver.c with the derivative function of every system (named after it).
+    """
+    from lagrangian import LagrangianToC
+
+    source = os.path.join(output_dir, "accuracy.c")
+    with open(source, "w") as f:
+        f.write(f'#include "{os.path.join(SOLVER_DIR, "solver.c")}"\n')
+        for system in systems:
+            f.write(LagrangianToC(system["L"], system["q"]).generate_c_function(system["name"]) + "\n")
+    compiler = CSharedLibraryCompiler(source_file=source, output_dir=output_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return compiler.compile(output_name="accuracy")
+
+
+def exact_pendulum(theta0: float, times: np.ndarray):
+    """
+    Pendulum released at rest from theta0:
+    theta = 2 asin(k sn(K - w t, k^2)), dtheta/dt = -2 k w cn(K - w t, k^2), k = sin(theta0/2).
+    """
+    import mpmath
+
+    omega = math.sqrt(PARAMETERS["g"] / PARAMETERS["l"])
+    k = math.sin(theta0 / 2)
+    K = mpmath.ellipk(k**2)
+    u = [K - omega * t for t in times]
+    theta = [2 * math.asin(k * float(mpmath.ellipfun("sn", ui, m=k**2))) for ui in u]
+    dtheta = [-2 * k * omega * float(mpmath.ellipfun("cn", ui, m=k**2)) for ui in u]
+    return np.array(theta)[:, None], np.array(dtheta)[:, None]
+
+
+def reference_run(system: Dict, q0: List[float], u0: List[float], times: np.ndarray, dt: float):
+    """
+    float64 RK4 with step `dt` (which must divide the times), sampled at `times`.
+    """
+    acc = system["accelerations"]
+    f = lambda q, u: (u, acc(q, u))
+    axpy = lambda a, x, y: [yi + a * xi for xi, yi in zip(x, y)]
+    q, u, t = list(q0), list(u0), 0.0
+    out_q, out_u = [], []
+    for target in times:
+        for _ in range(round((target - t) / dt)):
+            k1q, k1u = f(q, u)
+            k2q, k2u = f(axpy(dt / 2, k1q, q), axpy(dt / 2, k1u, u))
+            k3q, k3u = f(axpy(dt / 2, k2q, q), axpy(dt / 2, k2u, u))
+            k4q, k4u = f(axpy(dt, k3q, q), axpy(dt, k3u, u))
+            q = [qi + dt / 6 * (a + 2 * b + 2 * c + d) for qi, a, b, c, d in zip(q, k1q, k2q, k3q, k4q)]
+            u = [ui + dt / 6 * (a + 2 * b + 2 * c + d) for ui, a, b, c, d in zip(u, k1u, k2u, k3u, k4u)]
+        t = target
+        out_q.append(q)
+        out_u.append(u)
+    return np.array(out_q), np.array(out_u)
+
+
+# === INTEGRATION ===
+def integrate(solver, q0, u0, dt: float, steps: int, checkpoints: int = CHECKPOINTS):
+    """
+    `steps` steps of EOMSolver.advance, recording the state `checkpoints` times.
+    """
+    x, v = np.array(q0, dtype=np.float32), np.array(u0, dtype=np.float32)
+    out_x, out_v = np.empty((checkpoints, x.size)), np.empty((checkpoints, x.size))
+    t = 0.0
+    for k in range(checkpoints):
+        t = solver.advance(x, v, dt, steps // checkpoints, t)
+        out_x[k], out_v[k] = x, v
+    return out_x, out_v
+
+
+def integrate_next(solver, x0: float, dt: float, steps: int, checkpoints: int = CHECKPOINTS):
+    """
+    `steps` calls of next_1D from Python (the built-in force of solver.c).
+    """
+    x, v = np.full(1, x0, dtype=np.float32), np.zeros(1, dtype=np.float32)
+    new_x, new_v = np.empty_like(x), np.empty_like(v)
+    out_x = np.empty((checkpoints, 1))
+    for k in range(checkpoints):
+        for _ in range(steps // checkpoints):
+            solver.next_step(x, v, new_x, new_v, dt, 1)
+            x, new_x, v, new_v = new_x, x, new_v, v
+        out_x[k] = x
+    return out_x, None
+
+
+def measure(run: Callable, reference_q: np.ndarray, energy: Optional[Callable], E0: float) -> Dict:
+    """
+    Wall time (best of 3), largest error of the coordinates, and largest relative energy drift.
+    """
+    wall = best_time(run, repeat=3)
+    x, v = run()
+    error = float(np.max(np.abs(x - reference_q)))
+    drift = None
+    if energy is not None:
+        drift = max(abs(energy(xi, vi) - E0) for xi, vi in zip(x, v)) / abs(E0)
+    return dict(wall=wall, error=error, drift=drift)
+
+
+def sweep(path: str, system: Dict, q0, u0, reference_q: np.ndarray, time_steps: List[float],
+          t_end: float, integrators: List[str]) -> List[Dict]:
+    """
+    Work-precision rows of one system for every integrator and time step.
+    """
+    n = len(q0)
+    E0 = system["energy"](q0, u0)
+    rows = []
+    for integrator in integrators:
+        solver = cp.EOMSolver(path, 1, n, derivative=system["name"],
+                              integrator="langevin" if integrator == "verlet" else "rk4")
+        if integrator == "verlet":
+            solver.set_thermostat(friction=0.0, temperature=0.0)
+        for dt in time_steps:
+            steps = round(t_end / dt)
+            row = measure(lambda: integrate(solver, q0, u0, dt, steps), reference_q, system["energy"], E0)
+            evaluations = 4 * steps if integrator == "rk4" else steps + CHECKPOINTS
+            rows.append(dict(system=system["name"], integrator=integrator, dt=dt, steps=steps,
+                             evaluations=evaluations, **row))
+    return rows
+
+
+def sweep_next(path: str, time_steps: List[float], t_end: float) -> List[Dict]:
+    """
+    Work-precision rows of next_1D against x0 exp(-DECAY t).
+    """
+    solver = cp.EOMSolver(path, 1, 1)
+    times = t_end * np.arange(1, CHECKPOINTS + 1) / CHECKPOINTS
+    reference_q = np.exp(-DECAY * times)[:, None]
+    rows = []
+    for dt in time_steps:
+        steps = round(t_end / dt)
+        row = measure(lambda: integrate_next(solver, 1.0, dt, steps), reference_q, None, 1.0)
+        rows.append(dict(system="decay", integrator="next_1D", dt=dt, steps=steps,
+                         evaluations=4 * steps, **row))
+    return rows
+
+
+def orders(rows: List[Dict]) -> None:
+    """
+    Observed order of convergence between consecutive time steps (log error / log dt).
+    """
+    for previous, row in zip(rows, rows[1:]):
+        if (row["system"], row["integrator"]) != (previous["system"], previous["integrator"]):
+            continue
+        if row["error"] > 0 and previous["error"] > 0:
+            row["order"] = math.log(previous["error"] / row["error"]) / math.log(previous["dt"] / row["dt"])
+
+
+# === TABLES ===
+def print_table(rows: List[Dict]) -> None:
+    """
+    Work-precision table (Markdown) of the rows of one system.
+    """
+    print("| integrator | dt | steps | f evals | wall [s] | max error | order | energy drift |")
+    print("|---|---:|---:|---:|---:|---:|---:|---:|")
+    for r in rows:
+        order = f"{r['order']:.2f}" if "order" in r else "-"
+        drift = f"{r['drift']:.2e}" if r["drift"] is not None else "-"
+        print(f"| {r['integrator']} | {r['dt']:g} | {r['steps']} | {r['evaluations']} | "
+              f"{r['wall']:.2e} | {r['error']:.2e} | {order} | {drift} |")
+
+
+def cheapest(rows: List[Dict], targets: List[float] = TARGETS) -> Dict[float, Optional[Dict]]:
+    """
+    The fastest (integrator, dt) whose error meets each target, or None.
+    """
+    choice = {}
+    for target in targets:
+        candidates = [r for r in rows if r["error"] <= target]
+        choice[target] = min(candidates, key=lambda r: r["wall"]) if candidates else None
+    return choice
+
+
+def print_report(rows: List[Dict], notes: Dict[str, str]) -> None:
+    for system in dict.fromkeys(r["system"] for r in rows):
+        system_rows = [r for r in rows if r["system"] == system]
+        print(f"\n### {system}")
+        if system in notes:
+            print(notes[system] + "\n")
+        print_table(system_rows)
+        print()
+        for target, r in cheapest(system_rows).items():
+            best = f"{r['integrator']}, dt={r['dt']:g} ({r['wall']:.2e} s)" if r else "not reached"
+            print(f"error <= {target:g}: {best}")
+
+
+# === SUITE ===
+def accuracy(time_steps: List[float] = TIME_STEPS, t_end: float = T_END):
+    """
+    Rows of all systems, and notes on their references.
+    """
+    if any(round(t_end / dt) % CHECKPOINTS for dt in time_steps):
+        raise ValueError(f"t_end/dt must be a multiple of {CHECKPOINTS} for every dt.")
+    times = t_end * np.arange(1, CHECKPOINTS + 1) / CHECKPOINTS
+    pendulum, double = prepare("pendulum"), prepare("double_pendulum")
+    notes = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = build_library([pendulum, double], tmp)
+
+        exact_q, _ = exact_pendulum(THETA0, times)
+        omega = math.sqrt(PARAMETERS["g"] / PARAMETERS["l"])
+        small_angle = np.max(np.abs(THETA0 * np.cos(omega * times)[:, None] - exact_q))
+        notes["pendulum"] = (f"theta0 = {THETA0}, exact solution; the small-angle formula "
+                             f"theta0 cos(w t) differs from it by up to {small_angle:.1e}.")
+        rows = sweep(path, pendulum, [THETA0], [0.0], exact_q, time_steps, t_end, ["rk4", "verlet"])
+
+        q0, u0 = DOUBLE0
+        reference_q, _ = reference_run(double, q0, u0, times, REFERENCE_DT)
+        coarse_q, _ = reference_run(double, q0, u0, times, 2 * REFERENCE_DT)
+        notes["double_pendulum"] = (f"q0 = {q0}, float64 RK4 reference with dt = {REFERENCE_DT:g} "
+                                    f"(changes by {np.max(np.abs(coarse_q - reference_q)):.1e} "
+                                    f"with twice that step); 'verlet' is not used, as the "
+                                    f"accelerations depend on the velocities.")
+        rows += sweep(path, double, q0, u0, reference_q, time_steps, t_end, ["rk4"])
+
+        notes["decay"] = f"x0 = 1, dx/dt = -{DECAY:g} x (the force built into next_1D), x0 exp(-{DECAY:g} t)."
+        rows += sweep_next(path, time_steps, t_end)
+    orders(rows)
+    return rows, notes
+
+
+def records(rows: List[Dict]) -> List[Dict]:
+    """
+    Benchmark results of the rows: the error (lower is better), with the cost.
+    """
+    return [record(f"accuracy/{r['system']}/{r['integrator']}/dt={r['dt']:g}", r["error"],
+                   "max error", better="lower", wall=r["wall"], energy_drift=r["drift"],
+                   evaluations=r["evaluations"])
+            for r in rows]
+
+
+def run(time_steps: List[float] = TIME_STEPS, t_end: float = T_END) -> List[Dict]:
+    rows, _ = accuracy(time_steps, t_end)
+    return records(rows)
+
+
+if __name__ == "__main__":
+    from common import write_report
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dt", nargs="+", type=float, default=TIME_STEPS, help="time steps")
+    parser.add_argument("--t-end", type=float, default=T_END, help="integration time")
+    parser.add_argument("-o", "--output", help="JSON file for the results")
+    args = parser.parse_args()
+    rows, notes = accuracy(args.dt, args.t_end)
+    print_report(rows, notes)
+    if args.output:
+        write_report(records(rows), args.output)
@@ -0,0 +1,86 @@
+"""
+Code generation and compilation latency:
+LagrangianToC.generate_c_function and CSharedLibraryCompiler.compile.
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import contextlib
+import io
+import os
+import tempfile
+from typing import Dict, List
+
+# Local imports
+from common import SOLVER_DIR, best_time, record
+
+
+def pendulum():
+    """
+    Lagrangian and coordinates of the simple pendulum from lagrangian.py.
+    """
+    import sympy as sp
+    from sympy.physics.mechanics import dynamicsymbols
+    theta = dynamicsymbols('theta')
+    m, g, l = sp.symbols('m g l')
+    T = sp.Rational(1, 2) * m * (l * theta.diff())**2
+    V = m * g * l * (1 - sp.cos(theta))
+    return T - V, [theta]
+
+
+def double_pendulum():
+    """
+    Lagrangian and coordinates of the double pendulum from lagrangian.py.
+    """
+    import sympy as sp
+    from sympy.physics.mechanics import dynamicsymbols
+    t = dynamicsymbols._t
+    q1, q2 = dynamicsymbols('q1 q2')
+    m1, m2, l1, l2, g = sp.symbols('m1 m2 l1 l2 g')
+    x1, y1 = l1 * sp.sin(q1), -l1 * sp.cos(q1)
+    x2, y2 = x1 + l2 * sp.sin(q2), y1 - l2 * sp.cos(q2)
+    T = 0.5 * m1 * (x1.diff(t)**2 + y1.diff(t)**2) + 0.5 * m2 * (x2.diff(t)**2 + y2.diff(t)**2)
+    V = m1 * g * y1 + m2 * g * y2
+    return T - V, [q1, q2]
+
+
+SYSTEMS = {"pendulum": pendulum, "double_pendulum": double_pendulum}
+
+
+def bench_generate(repeat: int = 3) -> List[Dict]:
+    """
+    Wall time of generate_c_function for every system and mass-matrix mode.
+    """
+    from lagrangian import LagrangianToC
+
+    results = []
+    for name, system in SYSTEMS.items():
+        L, q = system()
+        gen = LagrangianToC(L, q)
+        for mode in ("symbolic", "cholesky"):
+            elapsed = best_time(lambda: gen.generate_c_function(name, mass_matrix=mode), repeat=repeat)
+            results.append(record(f"generate_c_function/{name}/{mode}", elapsed, "s", better="lower"))
+    return results
+
+
+def bench_compile(repeat: int = 3) -> List[Dict]:
+    """
+    Wall time of CSharedLibraryCompiler.compile for solver.c.
+    """
+    from ccompiler import CSharedLibraryCompiler
+
+    with tempfile.TemporaryDirectory() as tmp:
+        compiler = CSharedLibraryCompiler(source_file=os.path.join(SOLVER_DIR, "solver.c"),
+                                          output_dir=tmp)
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = best_time(compiler.compile, repeat=repeat)
+    return [record("compile/solver.c", elapsed, "s", better="lower")]
+
+
+def run() -> List[Dict]:
+    return bench_generate() + bench_compile()
+
+
+if __name__ == "__main__":
+    from common import print_results
+    print_results(run())
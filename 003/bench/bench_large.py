@@ -0,0 +1,105 @@
+"""
+Large-N path: a memory-mapped state of 10^9 vectors in 3D (3*10^9 floats,
+past 2^31) filled by rng_uniform and stepped by next_3D through the bindings
+generated from solver.c. Samples across the whole state (around 2^31 and
+2^32 floats, and the last one) are checked against the RK4 step of the
+decay force built into solver.c (dxdt = -1e-3*x), so a truncated size or
+offset shows up as untouched (zero) or wrong values.
+
+    python3 bench_large.py                           # 10^9 vectors, 48 GB in /tmp
+    python3 bench_large.py --vectors 1e8 --dir /scratch
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+# Third party imports
+import numpy as np
+
+# Local imports
+from common import BENCH_DIR, record
+import cprototype as cp
+from ccompiler import CSharedLibraryCompiler
+
+# === CONSTANTS ===
+VECTORS = 10**9
+DT      = 0.01
+DECAY   = 1e-3  # dxdt = -DECAY*x in solver.c
+
+
+def expected_step(x: np.ndarray, dt: float = DT) -> np.ndarray:
+    """
+    next_*D of dxdt = -DECAY*x: x times the RK4 series of exp(-DECAY*dt).
+    """
+    h = DECAY * dt
+    return x * (1.0 - h + h**2 / 2 - h**3 / 6 + h**4 / 24)
+
+
+def sample_indices(size: int) -> np.ndarray:
+    """
+    Float offsets at the edges of 32-bit indexing, and the ends of the state.
+    """
+    edges = [0, 1, 2**31 - 1, 2**31, 2**31 + 1, 2**32 - 1, 2**32, size // 2, size - 1]
+    return np.unique([i for i in edges if i < size])
+
+
+def bench_memmap(vectors: int = VECTORS, D: int = 3, directory: str = None) -> List[Dict]:
+    """
+    Fill and step a memory-mapped state of `vectors` D-vectors, and validate it.
+    """
+    with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory(dir=directory) as data:
+        compiler = CSharedLibraryCompiler(source_file=os.path.join(BENCH_DIR, "harmonic.c"),
+                                          output_dir=tmp)
+        with contextlib.redirect_stdout(io.StringIO()):
+            path = compiler.compile(output_name="solver_large")
+        solver = cp.EOMSolver(path, vectors, DIMENSIONS=D)
+
+        # Sparse files: only the pages written by noise() and next_3D take disk space
+        x, v, new_x, new_v = (np.memmap(os.path.join(data, f"{name}.f32"), dtype=np.float32,
+                                        mode="w+", shape=(vectors, D))
+                              for name in ("x", "v", "new_x", "new_v"))
+        size = vectors * D
+
+        start = time.perf_counter()
+        solver.noise(x, "uniform")
+        fill = time.perf_counter() - start
+
+        start = time.perf_counter()
+        solver.next_step(x, v, new_x, new_v, DT, vectors)
+        step = time.perf_counter() - start
+
+        flat_x, flat_new_x = x.reshape(-1), new_x.reshape(-1)
+        indices = sample_indices(size)
+        sampled = flat_x[indices].astype(np.float64)
+        filled = bool(np.all((sampled > 0.0) & (sampled < 1.0)))
+        stepped = bool(np.allclose(flat_new_x[indices], expected_step(sampled), rtol=1e-6, atol=0.0))
+        if not (filled and stepped):
+            print(f"[Bench] Large-N check failed at float offsets {indices.tolist()}")
+        del x, v, new_x, new_v, flat_x, flat_new_x
+
+    name = f"N={vectors}/D={D}"
+    return [record(f"large/rng_uniform/{name}", size / fill, "floats/s", ok=filled),
+            record(f"large/next_{D}D/{name}", vectors / step, "particle-steps/s", ok=stepped,
+                   floats=size, past_2_31=size > 2**31)]
+
+
+def run(vectors: int = VECTORS, D: int = 3, directory: str = None) -> List[Dict]:
+    return bench_memmap(vectors, D, directory)
+
+
+if __name__ == "__main__":
+    from common import print_results
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=float, default=VECTORS, help="number of vectors N")
+    parser.add_argument("--dimensions", type=int, default=3, choices=(1, 2, 3), help="D")
+    parser.add_argument("--dir", help="directory of the memory-mapped files (default: temporary)")
+    args = parser.parse_args()
+    print_results(run(int(args.vectors), args.dimensions, args.dir))
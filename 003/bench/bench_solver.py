@@ -0,0 +1,201 @@
+"""
+Throughput of libsolver: next_1D/2D/3D, RK4_1D/2D/3D, EOMSolver.advance
+(also with events), the Python-side marshalling done by
+Animation2D.update_frame, and the checkpoints of an animation.
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import contextlib
+import io
+import math
+import os
+import tempfile
+from ctypes import c_void_p, cast
+from typing import Dict, List
+
+# Third party imports
+import numpy as np
+
+# Local imports
+from common import BENCH_DIR, calls_per_second, record
+import cbindings
+import cprototype as cp
+from ccompiler import CSharedLibraryCompiler
+
+# === CONSTANTS ===
+SIZES = [10**k for k in range(7)]  # N = 1 ... 10^6
+DT    = 0.01
+
+
+def build_library(output_dir: str) -> str:
+    """
+    Compile solver.c together with the benchmark derivative functions.
+    """
+    compiler = CSharedLibraryCompiler(source_file=os.path.join(BENCH_DIR, "harmonic.c"),
+                                      output_dir=output_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return compiler.compile(output_name="solver_bench")
+
+
+def bench_next(path: str, sizes: List[int] = SIZES) -> List[Dict]:
+    """
+    Steps per second of next_1D/2D/3D on preallocated arrays.
+    """
+    results = []
+    for D in (1, 2, 3):
+        for N in sizes:
+            solver = cp.EOMSolver(path, N, DIMENSIONS=D)
+            x, v, new_x, new_v = (np.zeros((N, D), dtype=np.float32) for _ in range(4))
+            args = [a.ctypes.data_as(solver.c_vec_ptr) for a in (x, v, new_x, new_v)]
+            rate = calls_per_second(lambda: solver.next_step(*args, DT, N))
+            results.append(record(f"next_{D}D/N={N}", rate, "steps/s", particle_steps=rate * N))
+    return results
+
+
+def bench_RK4(path: str, sizes: List[int] = SIZES) -> List[Dict]:
+    """
+    Steps per second of RK4_1D/2D/3D with a harmonic oscillator as `dfdx`.
+    """
+    results = []
+    lib = cp.cdll.LoadLibrary(path)
+    functions = cbindings.bind(lib, cbindings.load([cp.SOLVER_SOURCE]))
+    for D in (1, 2, 3):
+        rk4 = functions[f"RK4_{D}D"]
+        dfdx = cast(getattr(lib, f"harmonic_{D}D"), c_void_p)
+        for N in sizes:
+            x, v, dx, dv = (np.ones((N, D), dtype=np.float32) for _ in range(4))
+            rate = calls_per_second(lambda: rk4(x, v, dx, dv, 0.0, DT, dfdx, N))
+            results.append(record(f"RK4_{D}D/N={N}", rate, "steps/s", particle_steps=rate * N))
+    return results
+
+
+def bench_advance(path: str, sizes: List[int] = SIZES, steps: int = 10) -> List[Dict]:
+    """
+    Steps per second of EOMSolver.advance (RK4 looped in C, in place).
+    """
+    results = []
+    for D in (1, 2, 3):
+        for N in sizes:
+            solver = cp.EOMSolver(path, N, DIMENSIONS=D, derivative=f"harmonic_{D}D")
+            x, v = np.ones((N, D), dtype=np.float32), np.zeros((N, D), dtype=np.float32)
+            rate = steps * calls_per_second(lambda: solver.advance(x, v, DT, steps))
+            results.append(record(f"advance_{D}D/N={N}", rate, "steps/s", particle_steps=rate * N))
+    return results
+
+
+def bench_events(path: str, dt: float = 0.0137, seconds: float = 20.0) -> List[Dict]:
+    """
+    Steps per second of EOMSolver.advance with events, checking that each
+    crossing of x = 1/2 by x = cos(t) is recorded once, also when the
+    action leaves the state at the root unchanged.
+    """
+    solver = cp.EOMSolver(path, 1, DIMENSIONS=1, derivative="harmonic_1D")
+    solver.set_events("half_amplitude", 1, "no_action")
+    steps = int(seconds / dt)
+    exact = sorted(t for k in range(int(seconds / (2 * math.pi)) + 1)
+                   for t in (2 * math.pi * k + math.pi / 3, 2 * math.pi * k + 5 * math.pi / 3)
+                   if t < steps * dt)
+
+    def run_events():
+        x, v = np.ones(1, dtype=np.float32), np.zeros(1, dtype=np.float32)
+        solver.advance(x, v, dt, steps)
+
+    rate = steps * calls_per_second(run_events)
+    times = [event["t"] for event in solver.events]
+    ok = len(times) == len(exact) and all(abs(a - b) < 1e-3 for a, b in zip(times, exact))
+    if not ok:
+        print(f"[Bench] Events at {times}, expected {exact}")
+    return [record("advance_events_1D/N=1", rate, "steps/s", ok=ok, events=len(times))]
+
+
+def bench_resume(path: str, frames: int = 60, interrupt: int = 25) -> List[Dict]:
+    """
+    Time to save and load a checkpoint of an Animation2D with a `sampler`,
+    checking that a run interrupted after `interrupt` frames and restored
+    from the checkpoint ends bit for bit like an uninterrupted one.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import animation as anim
+    from checkpoint import load_checkpoint, save_checkpoint
+
+    N = 3
+    def animation():
+        solver = cp.EOMSolver(path, N, DIMENSIONS=2, derivative="harmonic_2D")
+        positions = [solver.vector(x=np.cos(i), y=np.sin(i)) for i in range(N)]
+        ani = anim.Animation2D(vector_factory=solver.vector, c_arr=solver.c_arr,
+                               positions=positions, velocities=[solver.vector() for _ in range(N)],
+                               dt=0.07, NUMBER_OF_PARTICLES=N, sampler=solver, frame_dt=1 / 30)
+        ani.create_canvas()
+        return ani
+
+    uninterrupted = animation()
+    for frame in range(frames):
+        uninterrupted.update_frame(frame)
+
+    interrupted = animation()
+    for frame in range(interrupt):
+        interrupted.update_frame(frame)
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "state.npz")
+        roundtrip = lambda: save_checkpoint(checkpoint, interrupted.state()) or load_checkpoint(checkpoint)
+        seconds = 1.0 / calls_per_second(roundtrip)
+        resumed = animation()
+        resumed.restore(roundtrip())
+    for frame in range(interrupt, frames):
+        resumed.update_frame(frame)
+
+    expected, state = uninterrupted.state(), resumed.state()
+    ok = all(np.array_equal(expected[key], state[key]) for key in ("positions", "velocities")) \
+        and expected["time"] == state["time"]
+    if not ok:
+        print("[Bench] The resumed animation differs from the uninterrupted one")
+    for ani in (uninterrupted, interrupted, resumed):
+        plt.close(ani.fig)
+    return [record(f"checkpoint_roundtrip/N={N}", seconds, "s", better="lower", ok=ok)]
+
+
+def bench_marshalling(path: str, sizes: List[int] = (1, 10, 100, 1000)) -> List[Dict]:
+    """
+    Time per frame of Animation2D.update_frame (without drawing), compared
+    with the bare next_2D call: the difference is the cost of converting
+    the Python lists of Vector2D to ctypes arrays and back.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import animation as anim
+
+    results = []
+    for N in sizes:
+        solver = cp.EOMSolver(path, N, DIMENSIONS=2)
+        positions = [solver.vector(x=np.cos(i), y=np.sin(i)) for i in range(N)]
+        velocities = [solver.vector() for _ in range(N)]
+        ani = anim.Animation2D(vector_factory=solver.vector, c_arr=solver.c_arr,
+                               next_step=solver.next_step, positions=positions,
+                               velocities=velocities, dt=DT, NUMBER_OF_PARTICLES=N)
+        ani.create_canvas()
+        frame = 1.0 / calls_per_second(lambda: ani.update_frame(0))
+
+        arrays = [solver.c_arr() for _ in range(4)]
+        step = 1.0 / calls_per_second(lambda: solver.next_step(*arrays, DT, N))
+
+        results.append(record(f"update_frame/N={N}", frame, "s/frame", better="lower"))
+        results.append(record(f"marshalling/N={N}", max(frame - step, 0.0), "s/frame", better="lower"))
+        plt.close(ani.fig)
+    return results
+
+
+def run(sizes: List[int] = SIZES) -> List[Dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = build_library(tmp)
+        return (bench_next(path, sizes) + bench_RK4(path, sizes)
+                + bench_advance(path, sizes) + bench_events(path) + bench_resume(path)
+                + bench_marshalling(path))
+
+
+if __name__ == "__main__":
+    from common import print_results
+    print_results(run())
@@ -0,0 +1,59 @@
+"""
+Startup cost of the run modules, measured with `python -X importtime`.
+Also checks that the heavy dependencies (matplotlib, sympy) and the
+compiler wrapper are not imported by modules that do not need them.
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import subprocess
+import sys
+from typing import Dict, List
+
+# Local imports
+from common import RUN_DIR, record
+
+# Module -> heavy modules it must NOT import at startup
+MODULES = {
+    "cprototype": ("numpy", "matplotlib", "sympy", "ccompiler"),
+    "ccompiler":  ("numpy", "matplotlib", "sympy"),
+    "profiling":  ("numpy", "matplotlib", "sympy"),
+    "lagrangian": ("matplotlib", "sympy"),
+    "animation":  ("matplotlib", "sympy", "ccompiler"),
+}
+
+
+def import_time(module: str, forbidden=(), repeat: int = 5):
+    """
+    Best cumulative import time of `module` (in seconds) in a fresh
+    interpreter, and the forbidden modules found in sys.modules afterwards.
+    """
+    code = (f"import sys, {module}; "
+            f"print(','.join(m for m in {tuple(forbidden)!r} if m in sys.modules))")
+    best, loaded = float('inf'), []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=RUN_DIR,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        # Lines: 'import time: self [us] | cumulative | imported package'
+        for line in proc.stderr.splitlines():
+            fields = [f.strip() for f in line.split("|")]
+            if len(fields) == 3 and fields[2] == module:
+                best = min(best, 1e-6 * int(fields[1]))
+        loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return best, loaded
+
+
+def run() -> List[Dict]:
+    results = []
+    for module, forbidden in MODULES.items():
+        elapsed, loaded = import_time(module, forbidden)
+        if loaded:
+            print(f"[Bench] 'import {module}' also imports: {', '.join(loaded)}")
+        results.append(record(f"import/{module}", elapsed, "s", better="lower",
+                              ok=not loaded, loaded=loaded))
+    return results
+
+
+if __name__ == "__main__":
+    from common import print_results
+    print_results(run())
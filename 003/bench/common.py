@@ -0,0 +1,120 @@
+"""
+Shared helpers for the benchmark scripts: paths, timing and JSON reports.
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+# === PATHS ===
+BENCH_DIR  = os.path.abspath(os.path.dirname(__file__))
+RUN_DIR    = os.path.abspath(os.path.join(BENCH_DIR, '..', 'run'))
+SOLVER_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..', 'solver'))
+
+# The run modules are plain scripts importing each other by name
+if RUN_DIR not in sys.path:
+    sys.path.insert(0, RUN_DIR)
+
+
+# === TIMING ===
+def best_time(func: Callable[[], object], repeat: int = 5, number: int = 1) -> float:
+    """
+    Best wall time (in seconds) of `number` calls of `func`, out of `repeat` runs.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+def calls_per_second(func: Callable[[], object], min_time: float = 0.2, repeat: int = 3) -> float:
+    """
+    Calls per second of `func`. The number of calls per run is increased
+    until a single run lasts at least `min_time` seconds.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(1.2 * min_time / elapsed))
+    return 1.0 / best_time(func, repeat=repeat, number=number)
+
+
+def record(name: str, value: float, unit: str, better: str = "higher", **extra) -> Dict:
+    """
+    A single benchmark result. `better` is 'higher' or 'lower'.
+    """
+    return dict(name=name, value=value, unit=unit, better=better, **extra)
+
+
+# === REPORTS ===
+def metadata() -> Dict:
+    """
+    Host and toolchain description stored next to the results.
+    """
+    try:
+        gcc = subprocess.run(["gcc", "--version"], stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        gcc = None
+    meta = dict(host=platform.node(), machine=platform.machine(),
+                processor=platform.processor(), cpus=os.cpu_count(),
+                python=platform.python_version(), gcc=gcc,
+                timestamp=datetime.now(timezone.utc).isoformat())
+    for module in ("numpy", "sympy", "matplotlib"):
+        try:
+            meta[module] = __import__(module).__version__
+        except ImportError:
+            meta[module] = None
+    return meta
+
+
+def write_report(results: List[Dict], path: str) -> None:
+    """
+    Write results (and metadata) to a JSON file.
+    """
+    with open(path, "w") as f:
+        json.dump(dict(meta=metadata(), results=results), f, indent=2)
+    print(f"[Bench] Results written to {path}")
+
+
+def print_results(results: List[Dict]) -> None:
+    for r in results:
+        print(f"{r['name']:<45} {r['value']:>14.6g} {r['unit']}")
+
+
+def compare(results: List[Dict], baseline_path: str, tolerance: float = 0.1) -> List[str]:
+    """
+    Compare results with a previous JSON report.
+    Returns the names of the benchmarks that regressed by more than `tolerance`.
+    """
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    print(f"{'benchmark':<45} {'baseline':>14} {'current':>14} {'speedup':>8}")
+    for r in results:
+        old: Optional[Dict] = baseline.get(r["name"])
+        if old is None or old["value"] == 0 or r["value"] == 0:
+            continue
+        speedup = r["value"] / old["value"] if r["better"] == "higher" else old["value"] / r["value"]
+        flag = ""
+        if speedup < 1.0 - tolerance:
+            regressions.append(r["name"])
+            flag = "  <-- regression"
+        print(f"{r['name']:<45} {old['value']:>14.6g} {r['value']:>14.6g} {speedup:>7.2f}x{flag}")
+    return regressions
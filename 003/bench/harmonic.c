@@ -0,0 +1,40 @@
+/* Benchmark build of libsolver: solver.c plus derivative functions
+ * of a unit harmonic oscillator (x'' = -x in every component),
+ * to be passed as `dfdx` to RK4_1D, RK4_2D, and RK4_3D,
+ * and an event at x = 1/2 with an action that changes nothing.
+ */
+#include "../solver/solver.c"
+
+void harmonic_1D(float* x, float* v, float* dx, float* dv, float t, size_t N){
+	for(size_t i=0U; i<N; ++i){
+		dx[i] =  v[i];
+		dv[i] = -x[i];
+	}
+	return;
+}
+
+void harmonic_2D(Vector2D* x, Vector2D* v, Vector2D* dx, Vector2D* dv, float t, size_t N){
+	for(size_t i=0U; i<N; ++i){
+		dx[i].x =  v[i].x; dx[i].y =  v[i].y;
+		dv[i].x = -x[i].x; dv[i].y = -x[i].y;
+	}
+	return;
+}
+
+void harmonic_3D(Vector3D* x, Vector3D* v, Vector3D* dx, Vector3D* dv, float t, size_t N){
+	for(size_t i=0U; i<N; ++i){
+		dx[i].x =  v[i].x; dx[i].y =  v[i].y; dx[i].z =  v[i].z;
+		dv[i].x = -x[i].x; dv[i].y = -x[i].y; dv[i].z = -x[i].z;
+	}
+	return;
+}
+
+void half_amplitude(float* x, float* v, float t, float* g, size_t N){
+	for(size_t i=0U; i<N; ++i)
+		g[i] = x[i] - 0.5f;
+	return;
+}
+
+int no_action(float* x, float* v, float t, size_t event, size_t N){
+	return 0;
+}
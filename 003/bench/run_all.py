@@ -0,0 +1,62 @@
+"""
+Run the whole benchmark suite and store the results as JSON.
+
+    python3 run_all.py -o results.json
+    python3 run_all.py -o new.json --compare results.json
+    python3 run_all.py --only startup
+    python3 run_all.py --only large           # 10^9 memory-mapped vectors, not run by default
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import argparse
+import sys
+
+# Local imports
+import common
+import bench_accuracy
+import bench_codegen
+import bench_large
+import bench_solver
+import bench_startup
+
+SUITES = {
+    "solver":   bench_solver.run,
+    "codegen":  bench_codegen.run,
+    "startup":  bench_startup.run,
+    "accuracy": bench_accuracy.run,
+    "large":    bench_large.run,
+}
+# Suites run without --only (the large one writes tens of GB)
+DEFAULT = ["solver", "codegen", "startup", "accuracy"]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file for the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="previous JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative slowdown reported as a regression (default: 0.1)")
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=DEFAULT,
+                        help="run only the selected suites")
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.only:
+        print(f"[Bench] Running '{name}'...")
+        results.extend(SUITES[name]())
+    common.print_results(results)
+    common.write_report(results, args.output)
+
+    # Checks (e.g. no heavy imports at startup) fail the run
+    failed = [r["name"] for r in results if not r.get("ok", True)]
+    for name in failed:
+        print(f"[Bench] Check failed: {name}")
+
+    if args.compare and common.compare(results, args.compare, args.tolerance):
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,17 +6,33 @@ import itertools as it
 # and ctypes (https://docs.python.org/3/library/ctypes.html)
 import numpy as np
 
-# Matplotlib (https://matplotlib.org/) 
-# imports for plotting and animation
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-import matplotlib.animation as animation
+# Matplotlib (https://matplotlib.org/) is imported for plotting and animation
+# only when a canvas is created, so this module is cheap to import.
+
+# Local imports
+from profiling import PhaseTimer
 
 
 class Animation2D:
     def __init__(self,vector_factory=None, c_arr=None,
                  next_step=None,positions=None, velocities=None,
-                 dt=0.01,NUMBER_OF_PARTICLES=1):
+                 dt=0.01,NUMBER_OF_PARTICLES=1, profile=False, checkpointer=None,
+                 sampler=None, frame_dt=None):
+        """
+        If a `sampler` (an EOMSolver with a `derivative`) is given, the
+        integration runs with steps of `dt`, and the frames show the states
+        interpolated every `frame_dt` (see EOMSolver.sample), so the frame
+        rate does not force the step size; `next_step` is not used then.
+        If `profile` is True, the phases of `update_frame` are timed,
+        see `self.timer` (a profiling.PhaseTimer).
+        If a `checkpointer` (checkpoint.Checkpointer) is given, the state
+        is saved every `checkpointer.interval` frames; see `restore()`.
+        """
+        self.checkpointer = checkpointer
+        self.step = 0
+        self.time = 0.0
+        self.timer = PhaseTimer(enabled=profile)
+        self._frame_done = 0.0
         self.data = np.zeros((NUMBER_OF_PARTICLES, 2))
 
         self.vector = vector_factory
@@ -24,9 +40,11 @@ class Animation2D:
         self.next_step = next_step
         self.set_positions(positions)
         self.set_velocities(velocities)
-        self.colours = it.cycle(mcolors.TABLEAU_COLORS)
         self.dt = dt
         self.NUMBER_OF_PARTICLES = NUMBER_OF_PARTICLES
+        self.sampler = sampler
+        self.frame_dt = dt if frame_dt is None else frame_dt
+        self._grid = None # [positions, velocities, time] on the integration grid
 
     def set_positions(self, positions):
         self.positions = positions
@@ -36,11 +54,62 @@ class Animation2D:
     def set_velocities(self, velocities):
         self.velocities = velocities
 
+    def state(self):
+        """
+        Snapshot of the simulation state (see checkpoint.save_checkpoint).
+        With a `sampler`, the integration grid and the last interpolated
+        step are stored under 'workspace', so a restored run continues
+        bit for bit.
+        """
+        as_array = lambda vectors: np.frombuffer(self.c_arr(*vectors), dtype=np.float32) \
+                                     .reshape(self.NUMBER_OF_PARTICLES, -1).copy()
+        state = dict(positions=as_array(self.positions), velocities=as_array(self.velocities),
+                     time=self.time, step=self.step, dt=self.dt)
+        if self._grid is not None:
+            x, v, t = self._grid
+            workspace = dict(grid_positions=as_array(x), grid_velocities=as_array(v),
+                             grid_time=np.array([t]))
+            dense = self.sampler.sample_state()
+            if dense is not None:
+                workspace.update(dense=np.frombuffer(dense["dense"], dtype=np.float32).copy(),
+                                 dense_time=np.array([dense["time"]]))
+            state["workspace"] = workspace
+        return state
+
+    def restore(self, state):
+        """
+        Resume from a state returned by `state()` or checkpoint.load_checkpoint.
+        With a `sampler`, the integration grid and the last interpolated step
+        are restored too if the state has them; otherwise the grid restarts
+        at the restored state.
+        """
+        from_array = lambda array: self.c_arr.from_buffer_copy(
+            np.ascontiguousarray(array, dtype=np.float32).tobytes())
+        self.set_positions(from_array(state["positions"])[:])
+        self.set_velocities(from_array(state["velocities"])[:])
+        self.time = state["time"]
+        self.step = state["step"]
+        workspace = state.get("workspace") or {}
+        self._grid = None
+        if "grid_time" in workspace:
+            self._grid = [from_array(workspace["grid_positions"]), from_array(workspace["grid_velocities"]),
+                          float(workspace["grid_time"][0])]
+        if self.sampler is not None:
+            self.sampler.set_sample_state(
+                dict(dense=np.ascontiguousarray(workspace["dense"], dtype=np.float32),
+                     time=float(workspace["dense_time"][0])) if "dense" in workspace else None)
+        if self.checkpointer:
+            self.checkpointer.last_step = self.step
+
     def create_canvas(self,**kwargs):
         """
         This function sets up the Matplotlib figure and axes for the animation.
         It initializes the plot elements that will be updated in each frame.
         """
+        import matplotlib.pyplot as plt
+        import matplotlib.colors as mcolors
+
+        self.colours = it.cycle(mcolors.TABLEAU_COLORS)
         self.fig, self.ax = plt.subplots()
         self.ax.set_aspect('equal', adjustable='box')  # Ensure x and y axes have the same scale
         # Set plot limits and labels
@@ -60,6 +129,8 @@ class Animation2D:
         # 'points' is a scatter plot of the particles themselves
         self.points = self.ax.scatter(self.data[:, 0], self.data[:, 1],
                       c=[clr for clr, _ in zip(self.colours, range(self.NUMBER_OF_PARTICLES))], s=57)
+        if self.timer.enabled:
+            self.fig.canvas.mpl_connect('draw_event', self._on_draw)
 
     def update_frame(self, frame):
         """
@@ -67,6 +138,7 @@ class Animation2D:
         It calculates the new state of the simulation and updates the plot.
         """
         global positions,velocities
+        t = self.timer.start()
 
         # Create empty Vector2D objects to hold the C function results
         new_positions = [self.vector(x=0, y=0) for i in range(self.NUMBER_OF_PARTICLES)]
@@ -76,11 +148,16 @@ class Animation2D:
         c_velocities      = self.c_arr(*self.velocities)
         c_new_positions   = self.c_arr(*new_positions)
         c_new_velocities  = self.c_arr(*new_velocities)
+        t = self.timer.lap("marshal_in", t)
 
         # 1. Calculate the new positions and velocities
-        self.next_step(c_positions, c_velocities,
-                       c_new_positions, c_new_velocities,
-                       self.dt, self.NUMBER_OF_PARTICLES)
+        if self.sampler is None:
+            self.next_step(c_positions, c_velocities,
+                           c_new_positions, c_new_velocities,
+                           self.dt, self.NUMBER_OF_PARTICLES)
+        else:
+            c_new_positions, c_new_velocities = self._sample(self.time + self.frame_dt)
+        t = self.timer.lap("next_step", t)
         self.positions  = c_positions[:]
         self.velocities = c_velocities[:]
         new_positions   = c_new_positions[:]
@@ -93,6 +170,11 @@ class Animation2D:
 
             # 3. Update the NumPy plotting array
             new_position(self.data, i)
+        self.step += 1
+        self.time += self.dt if self.sampler is None else self.frame_dt
+        if self.checkpointer:
+            self.checkpointer.update(self.step, self.state)
+        t = self.timer.lap("marshal_out", t)
 
         # --- Update Matplotlib elements ---
         # Update the positions of the scattered points
@@ -102,8 +184,30 @@ class Animation2D:
         if self.NUMBER_OF_PARTICLES > 1:
             self.lines.set_xdata(np.append(self.data[:, 0], self.data[0, 0]))
             self.lines.set_ydata(np.append(self.data[:, 1], self.data[0, 1]))
+        self._frame_done = self.timer.lap("artists", t)
+
+    def _sample(self, time):
+        """
+        State at `time` interpolated by the `sampler` on its own grid of steps `dt`.
+        """
+        if self._grid is None:
+            self._grid = [self.c_arr(*self.positions), self.c_arr(*self.velocities), self.time]
+        x, v, t = self._grid
+        self._grid[2], positions, velocities = self.sampler.sample(x, v, self.dt, [time], t)
+        return positions[0], velocities[0]
+
+    def _on_draw(self, event):
+        """
+        Matplotlib 'draw_event' callback timing the rendering of a frame.
+        """
+        if self._frame_done:
+            self.timer.lap("draw", self._frame_done)
+            self._frame_done = 0.0
 
     def run_animation(self,frames=60,interval=30):
+        import matplotlib.pyplot as plt
+        import matplotlib.animation as animation
+
         self.ani = animation.FuncAnimation(fig=self.fig, func=self.update_frame,
                                            frames=frames , interval=interval)
         plt.show()
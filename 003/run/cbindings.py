@@ -0,0 +1,277 @@
+"""
+ctypes bindings generated from C prototypes.
+
+The signatures are parsed from C source: solver.c, the code emitted by
+LagrangianToC, or a header. The Python side never keeps a hand-written
+copy of a signature. The arguments are checked on every call:
+ - integers (`size_t`, `int`, `uint64_t`, ...) must fit in their C type,
+   so e.g. N >= 2^31 is never silently truncated;
+ - pointers accept NumPy arrays (including np.memmap) only if they have
+   the pointed type (float32 for `float*`, `Vector2D*` and `Vector3D*`),
+   are C-contiguous and aligned, and are writable unless the pointer is
+   `const`; ctypes arrays, pointers and byref() only if their elements
+   have the pointed type, or are flat arrays or structures of it (e.g.
+   `c_float*D` or Vector2D for `float*`); a raw address is passed only
+   as an explicit c_void_p;
+ - function pointers (e.g. `derivative_fn`) are passed as c_void_p.
+NumPy is not imported: arrays are recognised by `__array_interface__`.
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import ctypes
+import operator
+import os
+import re
+from ctypes import (c_double, c_float, c_int, c_int32, c_int64, c_size_t, c_uint32, c_uint64,
+                    c_void_p)
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# === C TYPES ===
+INTEGERS = {
+    "int": (c_int, -2**31, 2**31 - 1),
+    "int32_t": (c_int32, -2**31, 2**31 - 1),
+    "int64_t": (c_int64, -2**63, 2**63 - 1),
+    "uint32_t": (c_uint32, 0, 2**32 - 1),
+    "uint64_t": (c_uint64, 0, 2**64 - 1),
+    "size_t": (c_size_t, 0, 2**(8*ctypes.sizeof(c_size_t)) - 1),
+}
+FLOATS = {"float": c_float, "double": c_double}
+# NumPy type strings of the data behind a pointer (structures of floats are flat)
+ARRAY_TYPES = {"float": "<f4", "double": "<f8", "Vector2D": "<f4", "Vector3D": "<f4",
+               "uint32_t": "<u4", "uint64_t": "<u8"}
+CTYPE_TYPES = {c_float: "<f4", c_double: "<f8", c_uint32: "<u4", c_uint64: "<u8"}
+
+
+class Prototype(NamedTuple):
+    name: str
+    restype: str
+    args: List[str]       # C types of the arguments, e.g. 'const float*'
+    arg_names: List[str]
+
+
+class CheckedInteger:
+    """
+    argtype of an integer argument: rejects values out of range of the C type.
+    """
+
+    def __init__(self, ctype: str):
+        self.ctype = ctype
+        self.c_type, self.low, self.high = INTEGERS[ctype]
+
+    def from_param(self, value):
+        if type(value) is not int:
+            value = getattr(value, "value", value)  # e.g. c_size_t
+            try:
+                value = operator.index(value)  # int, bool, NumPy integers
+            except TypeError:
+                raise TypeError(f"Expected an integer for {self.ctype}, got {type(value).__name__}.") from None
+        if self.low <= value <= self.high:
+            return self.c_type(value)
+        raise OverflowError(f"{value} does not fit in {self.ctype}.")
+
+
+class CheckedPointer:
+    """
+    argtype of a data pointer: checks NumPy arrays, passes ctypes objects.
+    """
+
+    def __init__(self, ctype: str):
+        self.ctype = ctype
+        self.const = ctype.startswith("const ")
+        self.pointee = ctype.replace("const ", "").rstrip("*").strip()
+        self.typestr = ARRAY_TYPES.get(self.pointee)
+
+    def _check_element(self, element):
+        """
+        Reject ctypes data of another type than the pointed one; like
+        NumPy arrays, arrays and structures of one type are taken as flat
+        (e.g. `c_float*D` or Vector2D for `float*`).
+        """
+        while element.__name__ != self.pointee:
+            if issubclass(element, ctypes.Array):
+                element = element._type_
+            elif issubclass(element, ctypes.Structure) and len({f[1] for f in element._fields_}) == 1:
+                element = element._fields_[0][1]
+            else:
+                if self.typestr is None or CTYPE_TYPES.get(element) != self.typestr:
+                    raise TypeError(f"Expected {self.pointee} data for {self.ctype}, got {element.__name__}.")
+                return
+
+    def from_param(self, obj):
+        if obj is None or isinstance(obj, c_void_p):
+            return obj
+        if isinstance(obj, ctypes.Array):
+            self._check_element(type(obj))
+            return obj
+        if isinstance(obj, ctypes._Pointer):
+            self._check_element(type(obj)._type_)
+            return obj
+        interface = getattr(obj, "__array_interface__", None)
+        if interface is None:
+            if type(obj).__name__ == "CArgObject": # byref()
+                self._check_element(type(obj._obj))
+                return obj
+            raise TypeError(f"Expected an array for {self.ctype}, got {type(obj).__name__}.")
+        if self.typestr is None or interface["typestr"] != self.typestr:
+            raise TypeError(f"Expected {self.typestr} data for {self.ctype}, got {interface['typestr']}.")
+        address, readonly = interface["data"]
+        itemsize = int(self.typestr[2:])
+        if interface.get("strides") is not None:
+            # Strides are None for C-contiguous arrays, unless they are given explicitly
+            expected, strides = itemsize, []
+            for extent in reversed(interface["shape"]):
+                strides.insert(0, expected)
+                expected *= extent
+            if tuple(strides) != tuple(interface["strides"]):
+                raise ValueError(f"Expected a C-contiguous array for {self.ctype}.")
+        if address % itemsize:
+            raise ValueError(f"Expected an array aligned to {itemsize} bytes for {self.ctype}.")
+        if readonly and not self.const:
+            raise ValueError(f"Expected a writable array for {self.ctype}.")
+        return c_void_p(address)
+
+
+# === PARSER ===
+_COMMENTS = re.compile(r"/\*.*?\*/|//[^\n]*", re.S)
+_FUNCTION_POINTER_TYPEDEF = re.compile(r"^typedef\s+[\w\s\*]+\(\s*\*\s*(\w+)\s*\)", re.M)
+# A function at the top level (not indented): return type, name, arguments, then '{' or ';'
+_FUNCTION = re.compile(r"^(?!static\b|typedef\b|extern\b)([A-Za-z_][\w \t\*]*?)\b(\w+)\s*"
+                       r"\(((?:[^()]|\([^()]*\))*)\)\s*[{;]", re.M)
+
+
+def _split_args(args: str) -> List[str]:
+    """
+    Split an argument list at the commas outside parentheses.
+    """
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(args):
+        depth += char == "("
+        depth -= char == ")"
+        if char == "," and depth == 0:
+            parts.append(args[start:i])
+            start = i + 1
+    parts.append(args[start:])
+    return [part.strip() for part in parts if part.strip() not in ("", "void")]
+
+
+def _type_and_name(arg: str, function_types: Iterable[str]):
+    """
+    ('float*', 'x') from 'float* x'; function pointers have the type 'fn*'.
+    """
+    pointer = re.match(r"[\w\s]+\(\s*\*\s*(\w+)\s*\)", arg)
+    if pointer:
+        return "fn*", pointer.group(1)
+    match = re.match(r"(.*?)(\w+)\s*(\[\s*\w*\s*\])?$", arg)
+    ctype, name = " ".join(match.group(1).replace("*", " * ").split()), match.group(2)
+    if match.group(1).strip() in ("", "const", "unsigned", "struct"):
+        ctype, name = arg, ""  # an unnamed argument, e.g. 'float'
+    if match.group(3):
+        ctype += " *"
+    ctype = ctype.replace(" *", "*")
+    if ctype in function_types:
+        ctype = "fn*"
+    return ctype, name
+
+
+def parse(source: str) -> Dict[str, Prototype]:
+    """
+    Prototypes of the functions defined or declared at the top level of C
+    `source` (static functions are skipped).
+    Returns:
+        dict: name -> Prototype.
+    """
+    source = _COMMENTS.sub("", source)
+    function_types = set(_FUNCTION_POINTER_TYPEDEF.findall(source))
+    prototypes = {}
+    for restype, name, args in _FUNCTION.findall(source):
+        restype = " ".join(restype.replace("*", " * ").split()).replace(" *", "*")
+        if not restype or restype in ("return", "else"):
+            continue
+        typed = [_type_and_name(arg, function_types) for arg in _split_args(args)]
+        prototypes[name] = Prototype(name, restype, [t for t, _ in typed], [n for _, n in typed])
+    return prototypes
+
+
+@lru_cache(maxsize=None)
+def _parse_file(path: str, mtime: float) -> Dict[str, Prototype]:
+    with open(path) as f:
+        return parse(f.read())
+
+
+def load(sources: Iterable[str]) -> Dict[str, Prototype]:
+    """
+    Prototypes from C files or C code (later sources override earlier ones).
+    Args:
+        sources: paths to files, or strings of C code (e.g. LagrangianToC output).
+    """
+    prototypes = {}
+    for source in sources:
+        if "(" not in source and os.path.exists(source):
+            prototypes.update(_parse_file(os.path.abspath(source), os.path.getmtime(source)))
+        else:
+            prototypes.update(parse(source))
+    return prototypes
+
+
+# === BINDINGS ===
+def argtype(ctype: str, structures: Optional[Dict[str, type]] = None):
+    """
+    The ctypes argtype (or restype) of a C type.
+    """
+    if ctype == "void":
+        return None
+    if ctype in INTEGERS:
+        return CheckedInteger(ctype)
+    if ctype in FLOATS:
+        return FLOATS[ctype]
+    if ctype in ("fn*", "void*", "const void*"):
+        return c_void_p
+    if ctype.endswith("*"):
+        return CheckedPointer(ctype)
+    if structures and ctype in structures:
+        return structures[ctype]
+    raise TypeError(f"No ctypes equivalent of '{ctype}'.")
+
+
+def restype(ctype: str, structures: Optional[Dict[str, type]] = None):
+    """
+    The ctypes restype of a C type: plain ctypes (no checks on results).
+    """
+    if ctype in INTEGERS:
+        return INTEGERS[ctype][0]
+    pointee = ctype.replace("const ", "").rstrip("*").strip()
+    if ctype.endswith("*"):
+        if structures and pointee in structures:
+            return ctypes.POINTER(structures[pointee])
+        return c_void_p
+    return argtype(ctype, structures)
+
+
+def bind(lib, prototypes: Dict[str, Prototype], structures: Optional[Dict[str, type]] = None,
+         names: Optional[Iterable[str]] = None) -> Dict:
+    """
+    Set argtypes and restype of the functions of `lib` from their prototypes.
+    Functions missing from the library are skipped.
+    Args:
+        lib: a ctypes.CDLL.
+        structures: ctypes Structures of C structs returned by value or pointer
+            (e.g. {'SolverStats': SolverStats}).
+        names: bind only these functions (default: all).
+    Returns:
+        dict: name -> ctypes function.
+    """
+    functions = {}
+    for name in (names if names is not None else prototypes):
+        prototype = prototypes.get(name)
+        try:
+            function = getattr(lib, name)
+        except AttributeError:
+            continue
+        if prototype is None:
+            continue
+        function.argtypes = [argtype(ctype, structures) for ctype in prototype.args]
+        function.restype = restype(prototype.restype, structures)
+        functions[name] = function
+    return functions
@@ -1,7 +1,29 @@
 import subprocess
 import os
+import hashlib
+import json
+import multiprocessing
+import platform
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
+
+
+def _isolated(func: Callable, *args):
+    """
+    Call `func(*args)` in a fresh interpreter, which loads the library anew
+    and exits normally, so an instrumented library writes its profile.
+    `func` must be picklable (a module-level function, or a functools.partial of one),
+    and the main script must be guarded by `if __name__ == "__main__":`.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(func, *args).result()
+
+
+def _best_of(benchmark: Callable[[str], float], path: str, repeat: int) -> float:
+    return min(benchmark(path) for _ in range(repeat))
+
 
 class CSharedLibraryCompiler:
     """
@@ -9,6 +31,16 @@ class CSharedLibraryCompiler:
     using command line compilers (default: gcc).
     """
 
+    # Optimisation flags tried by `autotune()`, added to the flags without -O options
+    TUNING_CANDIDATES = {
+        "O2": ["-O2"],
+        "O3": ["-O3"],
+        "Ofast": ["-Ofast"],
+        "native": ["-Ofast", "-march=native"],
+        "native-lto": ["-Ofast", "-march=native", "-flto"],
+        "native-unroll": ["-Ofast", "-march=native", "-funroll-loops"],
+    }
+
     def __init__(
         self,
         source_file,
@@ -34,15 +66,26 @@ class CSharedLibraryCompiler:
         else:
             self.flags = flags
 
-    def compile(self, source_override: Optional[str] = None, output_name: Optional[str] = None, ) -> str:
+    def compile(self, source_override: Optional[str] = None, output_name: Optional[str] = None,
+                cached: bool = False) -> str:
         """
         Compiles the C file.
         Args:
             source_override: specific file to compile if not set in __init__.
             output_name: custom name for the library (without extension).
+            cached: skip the compiler if the library is newer than the source
+                    and was built with the same command (files included by
+                    the source are not tracked).
         Returns:
             str: The absolute path to the compiled library.
         """
+        target_source, output_path = self._resolve(source_override, output_name)
+        return self._build(target_source, output_path, self.flags, cached)
+
+    def _resolve(self, source_override: Optional[str] = None, output_name: Optional[str] = None):
+        """
+        The source file and the path of the library built from it.
+        """
         # 1. Resolve Source File
         target_source = Path(source_override) if source_override else self.source_file
 
@@ -73,22 +116,164 @@ class CSharedLibraryCompiler:
             # Defaults to source filename: 'mylib.c' -> 'libmylib.so'
             final_name = lib_prefix + target_source.stem + lib_ext
 
-        output_path = target_dir / final_name
+        return target_source, target_dir / final_name
+
+    def _build(self, target_source: Path, output_path: Path, flags: List[str], cached: bool = False) -> str:
+        """
+        Compile `target_source` into `output_path` with `flags`.
+        """
+        cmd = self._command(target_source, output_path, flags)
+
+        # 5. Reuse the previous build if nothing changed
+        # The command is stored next to the library, e.g. 'libsolver.so.cmd'
+        stamp_path = output_path.with_name(output_path.name + ".cmd")
+        stamp = ' '.join(cmd)
+        if cached and self._is_up_to_date(output_path, target_source, stamp_path, stamp):
+            print(f"[Compiler] Up to date: {output_path}")
+            return str(output_path.absolute())
+
+        # 6. Execute
+        print(f"[Compiler] Executing: {stamp}")
+
+        try:
+            result = subprocess.run(
+                cmd,
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            print(f"[Compiler] Success! Library created at: {output_path}")
+            stamp_path.write_text(stamp)
+            return str(output_path.absolute())
+
+        except subprocess.CalledProcessError as e:
+            print(f"[Compiler] Error:\n{e.stderr}")
+            raise RuntimeError("Compilation failed.") from e
+
+    def compile_pgo(self, workload: Callable[[str], object], source_override: Optional[str] = None,
+                    output_name: Optional[str] = None, cached: bool = False) -> str:
+        """
+        Profile-guided build in three steps:
+          1. compile with -fprofile-generate,
+          2. run `workload(path)` on the instrumented library in a fresh process,
+             which writes the profile when it exits,
+          3. recompile with -fprofile-use -flto -march=native.
+        Args:
+            workload: a representative run taking the path of the library, e.g.
+                functools.partial(cprototype.workload, derivative="pendulum").
+                It must be picklable (see `_isolated`).
+            cached: skip all steps if the optimised library is up to date
+                (as in `compile()`).
+        Returns:
+            str: The absolute path to the optimised library.
+        """
+        target_source, output_path = self._resolve(source_override, output_name)
+        # The profile is kept next to the library, e.g. 'libsolver.so.profile/'.
+        # Both builds write the same output, so the profile matches the object names.
+        profile_dir = output_path.with_name(output_path.name + ".profile")
+        generate = self.flags + ["-fprofile-generate", f"-fprofile-dir={profile_dir}"]
+        if "-fopenmp" in self.flags:
+            # Threads update the counters concurrently
+            generate.append("-fprofile-update=atomic")
+        use = self.flags + ["-march=native", "-flto", "-fprofile-use", f"-fprofile-dir={profile_dir}",
+                            "-fprofile-partial-training"]
+
+        stamp_path = output_path.with_name(output_path.name + ".cmd")
+        stamp = ' '.join(self._command(target_source, output_path, use))
+        if cached and profile_dir.exists() and \
+                self._is_up_to_date(output_path, target_source, stamp_path, stamp):
+            print(f"[Compiler] Up to date: {output_path}")
+            return str(output_path.absolute())
 
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        path = self._build(target_source, output_path, generate)
+        print(f"[Compiler] Profiling: {workload}")
+        _isolated(workload, path)
+        return self._build(target_source, output_path, use)
+
+    def autotune(self, benchmark: Callable[[str], float], source_override: Optional[str] = None,
+                 output_name: Optional[str] = None, candidates: Optional[Dict[str, List[str]]] = None,
+                 pgo: bool = True, repeat: int = 3, cached: bool = True) -> str:
+        """
+        Build the library with each candidate set of flags, time `benchmark`
+        on each build, and keep the fastest one as the library.
+        The choice is stored per host in 'autotune.json' next to the library,
+        so later calls (with `cached`) build the fastest variant directly.
+        Args:
+            benchmark: takes the path of a library and returns a time in seconds
+                (lower is better), e.g. functools.partial(cprototype.workload,
+                derivative="pendulum"). Each build is timed `repeat` times
+                in a fresh process, and must be picklable (see `_isolated`).
+            candidates: names and optimisation flags (default: TUNING_CANDIDATES).
+            pgo: also try the profile-guided build of `compile_pgo()`,
+                with `benchmark` as the workload.
+        Returns:
+            str: The absolute path to the fastest library.
+        """
+        target_source, output_path = self._resolve(source_override, output_name)
+        cache_path = output_path.parent / "autotune.json"
+        host = f"{platform.node()}/{platform.machine()}"
+        digest = hashlib.sha256(target_source.read_bytes()).hexdigest()
+        cache = json.loads(cache_path.read_text()) if cache_path.exists() else {}
+        entry = cache.get(host, {}).get(output_path.name)
+
+        # Flags other than the optimisation level are kept (e.g. warnings, -fopenmp)
+        base = [flag for flag in self.flags if not flag.startswith("-O")]
+        candidates = {name: base + flags
+                      for name, flags in (candidates or self.TUNING_CANDIDATES).items()}
+
+        if cached and entry is not None and entry["source"] == digest and \
+                entry["best"] in list(candidates) + ["pgo"] * pgo:
+            print(f"[Compiler] Tuned on {host}: {entry['best']}")
+            if entry["best"] == "pgo":
+                return self.compile_pgo(benchmark, source_override, output_name, cached=True)
+            return self._build(target_source, output_path, candidates[entry["best"]], cached=True)
+
+        times = {}
+        for name, flags in candidates.items():
+            trial_path = output_path.with_suffix(f".tune-{name}.so")
+            try:
+                path = self._build(target_source, trial_path, flags)
+            except RuntimeError:
+                continue  # e.g. a flag unknown to this compiler
+            times[name] = _isolated(_best_of, benchmark, path, repeat)
+            trial_path.unlink()
+            trial_path.with_name(trial_path.name + ".cmd").unlink()
+        if pgo:
+            path = self.compile_pgo(benchmark, source_override, output_name)
+            times["pgo"] = _isolated(_best_of, benchmark, path, repeat)
+        if not times:
+            raise RuntimeError("No candidate could be compiled.")
+
+        best = min(times, key=times.get)
+        for name, seconds in sorted(times.items(), key=lambda item: item[1]):
+            print(f"[Compiler] {name:<15} {seconds:.4g} s")
+        cache.setdefault(host, {})[output_path.name] = dict(
+            source=digest, best=best, flags=candidates.get(best), times=times)
+        cache_path.write_text(json.dumps(cache, indent=2))
+        if best == "pgo":
+            return str(output_path.absolute())
+        return self._build(target_source, output_path, candidates[best])
+
+    def _command(self, target_source: Path, output_path: Path, flags: List[str]) -> List[str]:
+        """
+        The compiler command building `output_path` from `target_source`.
+        """
         # 4. Construct Command
         # Start with compiler
         cmd = [self.compiler]
 
         # Add User Flags
-        cmd.extend(self.flags)
+        cmd.extend(flags)
 
         # Add Mandatory Flags for Shared Libraries
         # -shared: Create a shared library
         # -fPIC: Position Independent Code (Required for .so on Linux/Mac, ignored on Windows)
-        if "-shared" not in self.flags:
+        if "-shared" not in flags:
             cmd.append("-shared")
 
-        if "-fPIC" not in self.flags:
+        if "-fPIC" not in flags:
             cmd.append("-fPIC")
 
         # Add Output path
@@ -97,21 +282,19 @@ class CSharedLibraryCompiler:
         # Add Source path
         cmd.append(str(target_source))
 
-        # 5. Execute
-        print(f"[Compiler] Executing: {' '.join(cmd)}")
+        # Link the math library (after the source, as the linker requires)
+        if "-lm" not in flags:
+            cmd.append("-lm")
 
-        try:
-            result = subprocess.run(
-                cmd,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            print(f"[Compiler] Success! Library created at: {output_path}")
-            return str(output_path.absolute())
-
-        except subprocess.CalledProcessError as e:
-            print(f"[Compiler] Error:\n{e.stderr}")
-            raise RuntimeError("Compilation failed.") from e
+        return cmd
 
+    @staticmethod
+    def _is_up_to_date(output_path: Path, source: Path, stamp_path: Path, stamp: str) -> bool:
+        """
+        True if `output_path` is newer than `source` and was built with `stamp`.
+        """
+        if not output_path.exists() or not stamp_path.exists():
+            return False
+        if output_path.stat().st_mtime < source.stat().st_mtime:
+            return False
+        return stamp_path.read_text() == stamp
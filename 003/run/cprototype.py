@@ -3,10 +3,19 @@ A prototype Python script that demonstrates how to interface with a C library
 """
 
 # === IMPORTS ===
-# Numpy (https://numpy.org/)
-# and ctypes (https://docs.python.org/3/library/ctypes.html)
-import numpy as np
-from ctypes import c_float, c_int, Structure, POINTER, byref, cdll
+# Standard library imports
+import numbers
+import os
+
+# ctypes (https://docs.python.org/3/library/ctypes.html)
+# NumPy is not needed here: workers that only drive EOMSolver start faster.
+from ctypes import c_double, c_float, c_size_t, c_uint64, c_void_p, Structure, POINTER, byref, cast, cdll
+
+# Local imports
+import cbindings
+
+# The signatures of the library functions are read from the source
+SOLVER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'solver', 'solver.c')
 
 
 # === CTYPES STRUCTURE DEFINITION ===
@@ -27,7 +36,7 @@ class Vector2D(Structure):
         A helper method to update a numpy array (for plotting)
         with this vector's data at a specific index 'i'.
         """
-        data[i, :] = np.array((self.x, self.y))
+        data[i, :] = (self.x, self.y)
 
 class Vector3D(Structure):
     """
@@ -47,16 +56,69 @@ class Vector3D(Structure):
         A helper method to update a numpy array (for plotting)
         with this vector's data at a specific index 'i'.
         """
-        data[i, :] = np.array((self.x, self.y, self.z))
+        data[i, :] = (self.x, self.y, self.z)
+
+class SolverStats(Structure):
+    """
+    Mirror of the C `SolverStats` structure holding the profiling
+    counters of libsolver (filled only if compiled with -DSOLVER_PROFILE).
+    """
+    _fields_ = [("steps", c_uint64),
+                ("dfdx_calls", c_uint64),
+                ("stage", c_double * 4),
+                ("combine", c_double),
+                ("total", c_double)]
+
+    def as_dict(self):
+        return {"steps": self.steps,
+                "dfdx_calls": self.dfdx_calls,
+                "stage": list(self.stage),
+                "combine": self.combine,
+                "total": self.total}
+
+class EventRecord(Structure):
+    """
+    An event located by `advance_events_ND` (see EOMSolver.set_events).
+    """
+    _fields_ = [("t", c_float),
+                ("event", c_size_t),
+                ("step", c_size_t)]
+
+    def as_dict(self):
+        return {"t": self.t, "event": self.event, "step": self.step}
+
+# C structures returned by the library
+STRUCTURES = {"SolverStats": SolverStats, "EventRecord": EventRecord}
 
 class EOMSolver:
-    def __init__(self, path, NUMBER_OF_PARTICLES=1, DIMENSIONS=1):
+    def __init__(self, path, NUMBER_OF_PARTICLES=1, DIMENSIONS=1, derivative=None, seed=0,
+                 integrator="rk4", prototypes=()):
         """
         Load a C shared library from the specified path.
+        Args:
+            path: path to the shared library.
+            NUMBER_OF_PARTICLES: number of particles N.
+            DIMENSIONS: number of dimensions D (any positive integer).
+                For generalised coordinates use N=1 and D=n.
+            derivative: name of a C function in the library with the signature
+                `void f(float* x, float* v, float* dx, float* dv, float t, size_t N)`,
+                e.g. generated by LagrangianToC, used by `advance()`.
+            seed: seed of the counter-based random numbers, see `noise()`.
+            integrator: used by `advance()`, "rk4" (deterministic) or
+                "langevin" (BAOAB at constant temperature, see `set_thermostat()`).
+            prototypes: C files or code declaring further functions of the library
+                (e.g. the output of LagrangianToC), bound in `self.functions`
+                next to those of solver.c.
         """
+        if integrator not in ("rk4", "langevin"):
+            raise ValueError("integrator must be 'rk4' or 'langevin'.")
         self.lib = cdll.LoadLibrary(path)
+        # argtypes and restype generated from the C prototypes, see cbindings
+        self.functions = cbindings.bind(self.lib, cbindings.load([SOLVER_SOURCE, *prototypes]),
+                                        STRUCTURES)
         self.NUMBER_OF_PARTICLES = NUMBER_OF_PARTICLES
         self.DIMENSIONS = DIMENSIONS
+        self._c_arr = None
         if DIMENSIONS == 1:
             self.c_vec_ptr = POINTER(c_float)  # Alias for pointer to Vector1D
             self._prototype_1D()
@@ -66,10 +128,24 @@ class EOMSolver:
         elif DIMENSIONS == 3:
             self.c_vec_ptr = POINTER(Vector3D) # Alias for pointer to Vector3D
             self._prototype_3D()
+        elif DIMENSIONS > 3:
+            self.c_vec_ptr = POINTER(c_float)  # Vectors are passed as flat floats
+            self._prototype_ND()
         else:
-            raise ValueError("DIMENSIONS must be 1, 2, or 3.")
-        self.next_step.restype = None
-
+            raise ValueError("DIMENSIONS must be a positive integer.")
+        self._prototype_advance()
+        self._prototype_rng()
+        self.seed = seed
+        self.rng_counter = 0
+        self._event_fn = None
+        self.events = []
+        self._dense = None    # last step of `sample()`, see integrate_dense_ND
+        self._dense_t = None  # the time at which it ends
+        self.integrator = integrator
+        if integrator == "langevin":
+            self._prototype_langevin()
+            self.set_thermostat(friction=1.0, temperature=1.0)
+        self.dfdx = cast(getattr(self.lib, derivative), c_void_p) if derivative else None
 
     def _prototype_1D(self):
         """
@@ -79,10 +155,8 @@ class EOMSolver:
         exists in the C library.
         (IN coord, IN vel, OUT new_(pos|vel), IN dt, IN N)
         """
-        self.next_step = self.lib.next_1D
-        self.c_arr = c_float *self.NUMBER_OF_PARTICLES # Alias for pointer to an array of Vector1D
-        self.next_step.argtypes = [self.c_vec_ptr, self.c_vec_ptr,
-                                   self.c_vec_ptr, self.c_vec_ptr, c_float, c_int]
+        self.next_step = self.functions["next_1D"]
+        self.c_vec = c_float
 
     def _prototype_2D(self):
         """
@@ -91,10 +165,8 @@ class EOMSolver:
         `void next_2D(Vector2D* coord, Vector2D* vel, Vector2D* new_coord, Vector2D* new_vel, float dt, size_t N);`
         exists in the C library.
         """
-        self.next_step = self.lib.next_2D
-        self.c_arr = Vector2D*self.NUMBER_OF_PARTICLES # Alias for pointer to an array of Vector2D
-        self.next_step.argtypes = [self.c_vec_ptr, self.c_vec_ptr,
-                                   self.c_vec_ptr, self.c_vec_ptr, c_float, c_int]
+        self.next_step = self.functions["next_2D"]
+        self.c_vec = Vector2D
 
     def _prototype_3D(self):
         """
@@ -103,15 +175,292 @@ class EOMSolver:
         `void next_3D(Vector3D* coord, Vector3D* vel, Vector3D* new_coord, Vector3D* new_vel, float dt, size_t N);`
         exists in the C library.
         """
-        self.next_step = self.lib.next_3D
-        self.c_arr= Vector3D*self.NUMBER_OF_PARTICLES # Alias for pointer to an array of Vector3D
-        self.next_step.argtypes = [self.c_vec_ptr, self.c_vec_ptr,
-                                   self.c_vec_ptr, self.c_vec_ptr, c_float, c_int]
-        # assess function exists in the C library.
+        self.next_step = self.functions["next_3D"]
+        self.c_vec = Vector3D
+
+    def _prototype_ND(self):
+        """
+        Prototype the generic next step function from the C library.
+        Assuming function
+        `void next_ND(float* coord, float* vel, float* new_coord, float* new_vel, float dt, size_t N, size_t D);`
+        exists in the C library. `self.next_step` binds D, so it is called
+        exactly like next_1D/2D/3D.
+        """
+        self._next_ND = self.functions["next_ND"]
+        self.c_vec = c_float*self.DIMENSIONS
+        self.next_step = self.next_step_ND
 
-    def vector(self, x=0.0, y=0.0, z=0.0):
+    def next_step_ND(self, coord, vel, new_coord, new_vel, dt, N):
+        """
+        next_ND with D bound, called like next_1D/2D/3D with arrays of `self.c_arr`.
+        """
+        self._next_ND(coord, vel, new_coord, new_vel, dt, N, self.DIMENSIONS)
+
+    @property
+    def c_arr(self):
+        """
+        ctypes array type of N vectors, created on first use:
+        very large states are passed as NumPy arrays (e.g. np.memmap) instead.
+        """
+        if self._c_arr is None:
+            self._c_arr = self.c_vec*self.NUMBER_OF_PARTICLES
+        return self._c_arr
+
+    def _prototype_advance(self):
+        """
+        Prototype the in-place integrator from the C library.
+        Assuming function
+        `float advance_ND(float* x, float* v, float t, float dt, derivative_fn dfdx, size_t N, size_t D, size_t steps);`
+        exists in the C library.
+        """
+        self._advance = self.functions.get("advance_ND")
+
+    def _prototype_langevin(self):
+        """
+        Prototype the Langevin integrator from the C library.
+        Assuming function
+        `float langevin_ND(float* x, float* v, float t, float dt, derivative_fn dfdx,
+                           const float* gamma, const float* kT, size_t N, size_t D, size_t steps,
+                           uint64_t seed, uint64_t stream);`
+        exists in the C library.
+        """
+        self._langevin = self.functions["langevin_ND"]
+
+    def set_thermostat(self, friction, temperature):
+        """
+        Friction coefficient gamma and temperature kT (in units of
+        energy, masses are 1) of the Langevin integrator.
+        Args:
+            friction, temperature: a number, or a sequence of N numbers
+                (one per particle).
+        """
+        N = self.NUMBER_OF_PARTICLES
+        def per_particle(value, name):
+            values = [float(value)]*N if isinstance(value, numbers.Real) else [float(v) for v in value]
+            if len(values) != N:
+                raise ValueError(f"{name} must be a number or a sequence of {N} numbers.")
+            if min(values) < 0:
+                raise ValueError(f"{name} must not be negative.")
+            return (c_float*N)(*values)
+        self.friction = per_particle(friction, "friction")
+        self.temperature = per_particle(temperature, "temperature")
+
+    def set_events(self, function, K=1, action=None):
+        """
+        Detect events during `advance()`, see `advance_events_ND` in libsolver.
+        Args:
+            function: name of a C function in the library with the signature
+                `void g(float* x, float* v, float t, float* g, size_t N)`
+                filling K values; event k happens when g[k] changes sign
+                (e.g. generated by LagrangianToC.generate_event_function).
+            K: number of the values of g.
+            action: name of a C function
+                `int action(float* x, float* v, float t, size_t event, size_t N)`
+                called at each event, which may change x and v (e.g. reflect
+                the velocity) and returns nonzero to stop the integration.
+                Without it, the events are only recorded.
+            None as `function` disables the events.
+        """
+        if function is None:
+            self._event_fn = None
+            return
+        if K < 1:
+            raise ValueError("K must be a positive integer.")
+        self._advance_events = self.functions["advance_events_ND"]
+        self._event_fn = cast(getattr(self.lib, function), c_void_p)
+        self._event_action = cast(getattr(self.lib, action), c_void_p) if action else None
+        self._event_K = K
+
+    def advance(self, positions, velocities, dt, steps=1, t=0.0, max_events=1024):
+        """
+        Integrate `steps` steps of size `dt` in place, entirely in C,
+        using the `derivative` function given to the constructor and
+        the `integrator` (RK4, or Langevin with one force evaluation
+        per step and noise from `noise()`'s generator).
+        With `set_events()`, the events of this call (at most `max_events`)
+        are stored in `self.events` as dicts with 't', 'event', and 'step'.
+        Args:
+            positions, velocities: C-contiguous float32 arrays (e.g. NumPy)
+                of N*D elements, or ctypes arrays of `self.c_arr`.
+        Returns:
+            float: the final time.
+        """
+        if self.dfdx is None:
+            raise ValueError("advance() needs the name of a `derivative` function.")
+        if self._advance is None:
+            raise AttributeError("advance_ND not found in the C library.")
+        x, v = self._buffer(positions), self._buffer(velocities)
+        if self._event_fn is not None:
+            if self.integrator != "rk4":
+                raise ValueError("Events are only supported by the 'rk4' integrator.")
+            records = (EventRecord*max_events)()
+            time = c_float(t)
+            count = self._advance_events(x, v, byref(time), dt, self.dfdx,
+                                         self._event_fn, self._event_action, self._event_K,
+                                         self.NUMBER_OF_PARTICLES, self.DIMENSIONS, steps,
+                                         records, max_events)
+            self.events = [record.as_dict() for record in records[:min(count, max_events)]]
+            return time.value
+        if self.integrator == "langevin":
+            t = self._langevin(x, v, t, dt, self.dfdx, self.friction, self.temperature,
+                               self.NUMBER_OF_PARTICLES, self.DIMENSIONS, steps,
+                               self.seed, self.rng_counter)
+            self.rng_counter += steps
+            return t
+        return self._advance(x, v, t, dt, self.dfdx,
+                             self.NUMBER_OF_PARTICLES, self.DIMENSIONS, steps)
+
+    def _prototype_rng(self):
+        """
+        Prototype the random number generators from the C library.
+        Assuming functions
+        `void rng_uniform(float* out, size_t n, uint64_t seed, uint64_t stream);`
+        `void rng_normal(float* out, size_t n, uint64_t seed, uint64_t stream);`
+        exist in the C library.
+        """
+        self._rng = {kind: self.functions[f"rng_{kind}"] for kind in ("uniform", "normal")
+                     if f"rng_{kind}" in self.functions}
+
+    def noise(self, out, kind="normal"):
+        """
+        Fill `out` with one random number per component (N*D of them),
+        standard normal or uniform in (0, 1), and advance the counter.
+        The numbers depend only on (seed, counter), never on the number
+        of threads, so a run is reproduced by its seed.
+        Args:
+            out: C-contiguous float32 array of N*D elements, or `self.c_arr`.
+            kind: "normal" or "uniform".
+        """
+        if kind not in ("uniform", "normal"):
+            raise ValueError("kind must be 'uniform' or 'normal'.")
+        if kind not in self._rng:
+            raise AttributeError(f"rng_{kind} not found in the C library.")
+        self._rng[kind](self._buffer(out), self.NUMBER_OF_PARTICLES * self.DIMENSIONS,
+                        self.seed, self.rng_counter)
+        self.rng_counter += 1
+
+    def rng_state(self):
+        """
+        State of the random numbers, e.g. for checkpoint.save_checkpoint.
+        """
+        return {"seed": self.seed, "counter": self.rng_counter}
+
+    def set_rng_state(self, state):
+        """
+        Restore the state returned by `rng_state()`.
+        """
+        self.seed, self.rng_counter = state["seed"], state["counter"]
+
+    def sample(self, positions, velocities, dt, times, t=0.0):
+        """
+        Integrate RK4 steps of size `dt` in place (the same steps as
+        `advance()`) up to the step containing the last of `times`,
+        and return the states at `times`, interpolated with cubic Hermite
+        polynomials without extra evaluations of `derivative`.
+        A call continuing the previous one (at its final time) may also
+        sample times within the last step of that call.
+        Args:
+            positions, velocities: as in `advance()`.
+            times: ascending sequence of times, e.g. of the video frames.
+        Returns:
+            tuple: the final time, and the sampled positions and velocities
+                as ctypes arrays of len(times) arrays of `self.c_arr`
+                (`numpy.frombuffer(..., dtype=numpy.float32)` gives NumPy views).
+        """
+        if self.dfdx is None:
+            raise ValueError("sample() needs the name of a `derivative` function.")
+        times = list(times)
+        if any(b < a for a, b in zip(times, times[1:])):
+            raise ValueError("times must be in ascending order.")
+        dense = self.functions["integrate_dense_ND"]
+        M = self.NUMBER_OF_PARTICLES * self.DIMENSIONS
+        if self._dense is None:
+            self._dense = (c_float*(6*M + 1))()
+        history = self._dense_t is not None and self._dense_t == t
+        out_positions = (self.c_arr*len(times))()
+        out_velocities = (self.c_arr*len(times))()
+        t = dense(self._buffer(positions), self._buffer(velocities), t, dt, self.dfdx,
+                  self.NUMBER_OF_PARTICLES, self.DIMENSIONS, (c_float*len(times))(*times), len(times),
+                  out_positions, out_velocities, self._dense, history)
+        if t != t:  # NaN
+            self._dense_t = None
+            raise MemoryError("integrate_dense_ND could not allocate its workspace.")
+        self._dense_t = t
+        return t, out_positions, out_velocities
+
+    def sample_state(self):
+        """
+        The last step of `sample()` (see integrate_dense_ND), e.g. for
+        checkpoints: {'dense': ctypes array of 6*N*D + 1 floats, 'time': its
+        final time}, or None before the first call.
+        """
+        if self._dense_t is None:
+            return None
+        return {"dense": self._dense, "time": self._dense_t}
+
+    def set_sample_state(self, state):
+        """
+        Restore the last step of `sample()` from `sample_state()`, so the
+        next call continues it exactly as without the interruption.
+        `state['dense']` may be any buffer of float32 (e.g. a NumPy array).
+        None is the same as `reset_sample()`.
+        """
+        if state is None:
+            self.reset_sample()
+            return
+        size = 6 * self.NUMBER_OF_PARTICLES * self.DIMENSIONS + 1
+        self._dense = (c_float*size).from_buffer_copy(state["dense"])
+        self._dense_t = float(state["time"])
+
+    def reset_sample(self):
+        """
+        Forget the last step of `sample()`, so the next call starts a fresh
+        interval (e.g. after the state was restored from a checkpoint).
+        """
+        self._dense_t = None
+
+    def _buffer(self, array):
+        """
+        `array` itself, checking its size; its type, layout and
+        writability are checked by the bindings on every call.
+        """
+        size = self.NUMBER_OF_PARTICLES * self.DIMENSIONS
+        if hasattr(array, "__array_interface__"):
+            if array.size != size:
+                raise ValueError(f"Expected an array of {size} elements, got {array.size}.")
+            return array
+        if not isinstance(array, self.c_arr):
+            raise TypeError(f"Expected a NumPy array or {self.c_arr}.")
+        return array
+
+    def profiling(self):
+        """
+        True if the library was compiled with -DSOLVER_PROFILE.
+        """
+        if "solver_profiling" not in self.functions:
+            return False
+        return bool(self.functions["solver_profiling"]())
+
+    def stats(self):
+        """
+        Profiling counters of the library as a dict
+        (all zeros unless compiled with -DSOLVER_PROFILE).
+        """
+        if "solver_stats" not in self.functions:
+            return {}
+        return self.functions["solver_stats"]().contents.as_dict()
+
+    def reset_stats(self):
+        """
+        Zero the profiling counters of the library.
+        """
+        if "solver_stats_reset" in self.functions:
+            self.functions["solver_stats_reset"]()
+
+    def vector(self, x=0.0, y=0.0, z=0.0, *rest):
         """
         Create a new vector instance based on the specified DIMENSIONS.
+        For DIMENSIONS > 3 the components are (x, y, z, *rest).
         """
         if self.DIMENSIONS == 1:
             return c_float(x)
@@ -120,6 +469,32 @@ class EOMSolver:
         elif self.DIMENSIONS == 3:
             return Vector3D(x=x, y=y, z=z)
         else:
-            raise ValueError("DIMENSIONS must be 1, 2, or 3.")
+            return (c_float*self.DIMENSIONS)(x, y, z, *rest)
+
 
+# === WORKLOADS ===
+def workload(path, derivative, NUMBER_OF_PARTICLES=1, DIMENSIONS=1, dt=1e-3, seconds=2.0,
+             steps=1000, integrator="rk4"):
+    """
+    A representative run of a compiled system, for the profile-guided builds
+    and the auto-tuner of CSharedLibraryCompiler (`compile_pgo()`, `autotune()`):
+    random initial states are integrated with `EOMSolver.advance` in runs
+    of `steps` steps, for about `seconds` seconds.
+    Use functools.partial to fix the arguments other than `path`.
+    Returns:
+        float: the best time of one step, in seconds.
+    """
+    from time import perf_counter
 
+    solver = EOMSolver(path, NUMBER_OF_PARTICLES, DIMENSIONS, derivative=derivative,
+                       integrator=integrator)
+    x, v = solver.c_arr(), solver.c_arr()
+    best = float("inf")
+    start = perf_counter()
+    while perf_counter() - start < seconds:
+        solver.noise(x)
+        solver.noise(v)
+        t0 = perf_counter()
+        solver.advance(x, v, dt, steps)
+        best = min(best, (perf_counter() - t0) / steps)
+    return best
@@ -0,0 +1,228 @@
+"""
+Ensemble runner: many independent copies of a system (e.g. compiled from
+LagrangianToC) integrated with different initial conditions on all cores.
+
+Each worker process of a ProcessPoolExecutor loads the library once
+(in the pool initializer) and integrates members in C with
+EOMSolver.advance. The initial conditions and the results live in
+multiprocessing.shared_memory blocks, which the workers read and write
+as NumPy arrays, so no arrays are pickled. The members are split into
+small chunks taken by whichever worker is free (work stealing), so
+uneven members (e.g. with events) do not leave cores idle.
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+# Numpy (https://numpy.org/)
+import numpy as np
+
+# Local imports
+import cprototype as cp
+
+# === WORKER STATE ===
+# One solver per worker process, created by `_init_worker`
+_solver = None
+
+
+def _init_worker(path: str, derivative: str, N: int, D: int, integrator: str,
+                 thermostat: Optional[Tuple]) -> None:
+    """
+    Pool initializer: load the library once per worker.
+    """
+    global _solver
+    _solver = cp.EOMSolver(path, N, D, derivative=derivative, integrator=integrator)
+    if thermostat is not None:
+        _solver.set_thermostat(*thermostat)
+
+
+def _attach(name: str, shape: Tuple, dtype=np.float32):
+    """
+    An existing shared memory block and a NumPy view of it.
+    """
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _run_chunk(start: int, stop: int, blocks: Dict[str, Tuple[str, Tuple]],
+               dt: float, steps: int, record_every: int, seed: int) -> Tuple[int, int, float]:
+    """
+    Integrate the members [start, stop) in place in the shared arrays.
+    Returns (number of members, pid, seconds).
+    """
+    t0 = time.perf_counter()
+    attached = {key: _attach(name, shape) for key, (name, shape) in blocks.items()}
+    arrays = {key: array for key, (_, array) in attached.items()}
+    try:
+        x, v = arrays["positions"], arrays["velocities"]
+        trajectory = arrays.get("trajectory")
+        for i in range(start, stop):
+            # The noise of member i depends only on (seed, i), not on the chunking
+            _solver.set_rng_state({"seed": seed + i, "counter": 0})
+            if trajectory is None:
+                _solver.advance(x[i], v[i], dt, steps)
+                continue
+            t = 0.0
+            for frame in range(trajectory.shape[1]):
+                t = _solver.advance(x[i], v[i], dt, record_every, t)
+                trajectory[i, frame, 0] = x[i]
+                trajectory[i, frame, 1] = v[i]
+            _solver.advance(x[i], v[i], dt, steps - trajectory.shape[1]*record_every, t)
+    finally:
+        # The views must be gone before the blocks are closed
+        x = v = trajectory = None
+        arrays.clear()
+        for block, _ in attached.values():
+            block.close()
+    return stop - start, os.getpid(), time.perf_counter() - t0
+
+
+class Ensemble:
+    def __init__(self, path: str, derivative: str, NUMBER_OF_PARTICLES: int = 1, DIMENSIONS: int = 1,
+                 workers: Optional[int] = None, integrator: str = "rk4",
+                 thermostat: Optional[Tuple] = None, seed: int = 0):
+        """
+        Args:
+            path: path to the shared library (e.g. from CSharedLibraryCompiler.compile(cached=True)).
+            derivative: name of the derivative function, as for EOMSolver.
+            NUMBER_OF_PARTICLES, DIMENSIONS: size N*D of one member.
+            workers: number of processes (default: all cores).
+            integrator: "rk4" or "langevin", as for EOMSolver.
+            thermostat: (friction, temperature) of the Langevin integrator.
+            seed: member i uses the random numbers of seed + i.
+        """
+        self.path = path
+        self.derivative = derivative
+        self.NUMBER_OF_PARTICLES = NUMBER_OF_PARTICLES
+        self.DIMENSIONS = DIMENSIONS
+        self.workers = workers or os.cpu_count()
+        self.integrator = integrator
+        self.thermostat = thermostat
+        self.seed = seed
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shut the worker processes down.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """
+        The worker pool, started on first use and kept between runs,
+        so the library is loaded only once per worker.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker,
+                initargs=(self.path, self.derivative, self.NUMBER_OF_PARTICLES, self.DIMENSIONS,
+                          self.integrator, self.thermostat))
+        return self._executor
+
+    def run(self, positions: np.ndarray, velocities: np.ndarray, dt: float, steps: int,
+            record_every: Optional[int] = None, chunk_size: Optional[int] = None) -> Dict:
+        """
+        Integrate all members for `steps` steps of size `dt`.
+        Args:
+            positions, velocities: initial conditions, arrays of shape (members, N*D)
+                (or (members, N, D)).
+            record_every: if given, the state is recorded every `record_every` steps.
+            chunk_size: members per task (default: about 8 tasks per worker).
+        Returns:
+            dict: 'positions', 'velocities' (final states), 'trajectory' (if recorded,
+                shape (members, frames, 2, N*D)), 'elapsed' (seconds), 'throughput'
+                (member-steps per second), and 'members_per_worker' (the load balance).
+        """
+        M = self.NUMBER_OF_PARTICLES * self.DIMENSIONS
+        members = len(positions)
+        if np.size(positions) != members*M or np.size(velocities) != members*M:
+            raise ValueError(f"positions and velocities must have shape (members, {M}).")
+        if chunk_size is None:
+            chunk_size = max(1, members // (8 * self.workers))
+        shapes = {"positions": (members, M), "velocities": (members, M)}
+        if record_every:
+            shapes["trajectory"] = (members, steps // record_every, 2, M)
+
+        blocks = {}
+        arrays = {}
+        try:
+            for key, shape in shapes.items():
+                size = max(1, int(np.prod(shape)) * np.dtype(np.float32).itemsize)
+                blocks[key] = shared_memory.SharedMemory(create=True, size=size)
+                arrays[key] = np.ndarray(shape, dtype=np.float32, buffer=blocks[key].buf)
+            arrays["positions"][:] = np.reshape(positions, (members, M))
+            arrays["velocities"][:] = np.reshape(velocities, (members, M))
+            names = {key: (block.name, shapes[key]) for key, block in blocks.items()}
+
+            pool = self._pool()
+            t0 = time.perf_counter()
+            futures = [pool.submit(_run_chunk, start, min(start + chunk_size, members), names,
+                                   dt, steps, record_every or 0, self.seed)
+                       for start in range(0, members, chunk_size)]
+            per_worker = {}
+            for future in futures:
+                done, pid, _ = future.result()
+                per_worker[pid] = per_worker.get(pid, 0) + done
+            elapsed = time.perf_counter() - t0
+
+            result = {key: array.copy() for key, array in arrays.items()}
+        finally:
+            arrays.clear()
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+        result.update(elapsed=elapsed, throughput=members*steps/elapsed,
+                      members_per_worker=sorted(per_worker.values(), reverse=True))
+        return result
+
+
+# ==========================================
+# run as: python3 -m ensemble [members]
+# ==========================================
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    from sys import argv
+
+    import sympy as sp
+    from sympy.physics.mechanics import dynamicsymbols
+
+    from ccompiler import CSharedLibraryCompiler
+    from lagrangian import LagrangianToC
+
+    members = int(argv[1]) if len(argv) > 1 else 10000
+
+    # Simple pendulum (with the placeholder constants of LagrangianToC)
+    theta = dynamicsymbols('theta')
+    m, g, l = sp.symbols('m g l')
+    L = sp.Rational(1, 2) * m * (l * theta.diff())**2 - m * g * l * (1 - sp.cos(theta))
+    solver_c = Path(__file__).resolve().parent.parent / "solver" / "solver.c"
+    source = Path(tempfile.gettempdir()) / "ensemble_pendulum.c"
+    with open(source, "w") as f:
+        f.write(f'#include "{solver_c}"\n')
+        f.write(LagrangianToC(L, [theta]).generate_c_function("pendulum"))
+    path = CSharedLibraryCompiler(source).compile(cached=True)
+
+    # Sweep of initial angles
+    positions = np.linspace(0.1, 3.0, members, dtype=np.float32).reshape(members, 1)
+    velocities = np.zeros_like(positions)
+    with Ensemble(path, "pendulum", DIMENSIONS=1) as ensemble:
+        result = ensemble.run(positions, velocities, dt=0.05, steps=2000, record_every=100)
+    print(f"{members} members x 2000 steps on {ensemble.workers} workers: "
+          f"{result['elapsed']:.2f} s, {result['throughput']:.3g} member-steps/s")
+    print(f"members per worker: {result['members_per_worker']}")
+    print(f"final angles: {result['positions'][:5, 0]} ...")
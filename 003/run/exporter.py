@@ -0,0 +1,209 @@
+"""
+Offline video export, without the interactive GUI loop of Animation2D.
+
+Frames come from a recorded trajectory (an array of shape (frames, N, 2),
+e.g. from `record()`, which samples the headless solver at the frame times,
+or a trajectory of ensemble.Ensemble). They are rendered on the Agg backend
+by a pool of processes, each rendering a contiguous range of frames with one
+figure whose artists and buffers are reused for every frame. The frames are
+piped as raw RGB to ffmpeg (in order), or written as a PNG sequence.
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import itertools as it
+import os
+import shutil
+import subprocess
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Numpy (https://numpy.org/)
+import numpy as np
+
+# Matplotlib (https://matplotlib.org/) is imported in the rendering
+# processes only, with the Agg backend and without pyplot.
+
+# === WORKER STATE ===
+# One renderer per worker process, created by `_init_worker`
+_renderer = None
+
+
+class FrameRenderer:
+    """
+    Renders the frames of a trajectory with the look of Animation2D,
+    creating the figure and the artists once.
+    """
+
+    def __init__(self, trajectory: np.ndarray, size: Tuple[int, int] = (640, 480), dpi: int = 100,
+                 xlim: Sequence[float] = (-2.1, 2.1), ylim: Sequence[float] = (-2.1, 2.1)):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.colors import TABLEAU_COLORS
+        from matplotlib.figure import Figure
+
+        self.trajectory = trajectory
+        N = trajectory.shape[1]
+        self.fig = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.ax.set_aspect('equal', adjustable='box')
+        self.ax.set(xlim=xlim, ylim=ylim, xlabel='x', ylabel='y')
+        data = trajectory[0]
+        self.lines = None
+        if N > 1:
+            # Append first point to close the loop
+            self.lines = self.ax.plot(np.append(data[:, 0], data[0, 0]),
+                                      np.append(data[:, 1], data[0, 1]), lw=1)[0]
+        colours = [clr for clr, _ in zip(it.cycle(TABLEAU_COLORS), range(N))]
+        self.points = self.ax.scatter(data[:, 0], data[:, 1], c=colours, s=57)
+        self.canvas.draw()
+        self.width, self.height = self.canvas.get_width_height()
+
+    def render(self, frame: int) -> memoryview:
+        """
+        Draw one frame and return its RGBA buffer (valid until the next call).
+        """
+        data = self.trajectory[frame]
+        self.points.set_offsets(data[:, :2])
+        if self.lines is not None:
+            self.lines.set_data(np.append(data[:, 0], data[0, 0]), np.append(data[:, 1], data[0, 1]))
+        self.canvas.draw()
+        return self.canvas.buffer_rgba()
+
+    def rgb(self, frames: range) -> bytes:
+        """
+        Raw RGB24 bytes of consecutive frames.
+        """
+        out = np.empty((len(frames), self.height, self.width, 3), dtype=np.uint8)
+        for i, frame in enumerate(frames):
+            out[i] = np.asarray(self.render(frame))[:, :, :3]
+        return out.tobytes()
+
+    def png(self, frames: range, pattern: str) -> None:
+        """
+        Write the frames as PNG files named `pattern % frame`.
+        """
+        from matplotlib.image import imsave
+
+        for frame in frames:
+            imsave(pattern % frame, np.asarray(self.render(frame)), format="png")
+
+
+def _init_worker(trajectory: np.ndarray, options: Dict) -> None:
+    """
+    Pool initializer: one renderer (figure and artists) per worker.
+    """
+    global _renderer
+    _renderer = FrameRenderer(trajectory, **options)
+
+
+def _render_rgb(start: int, stop: int) -> bytes:
+    return _renderer.rgb(range(start, stop))
+
+
+def _render_png(start: int, stop: int, pattern: str) -> int:
+    _renderer.png(range(start, stop), pattern)
+    return stop - start
+
+
+def record(solver, positions: np.ndarray, velocities: np.ndarray, dt: float,
+           frames: int, fps: float = 30.0, t: float = 0.0) -> np.ndarray:
+    """
+    Run the headless solver and sample it at `frames` times 1/`fps` apart
+    (EOMSolver.sample), independently of the step `dt`.
+    Returns:
+        np.ndarray: positions of shape (frames, N, D).
+    """
+    times = t + np.arange(1, frames + 1) / fps
+    _, sampled, _ = solver.sample(positions, velocities, dt, times, t)
+    return np.frombuffer(sampled, dtype=np.float32).reshape(
+        frames, solver.NUMBER_OF_PARTICLES, solver.DIMENSIONS)
+
+
+def export(trajectory: np.ndarray, output: str, fps: float = 30.0, workers: Optional[int] = None,
+           chunk: int = 32, ffmpeg: str = "ffmpeg", ffmpeg_args: Optional[List[str]] = None,
+           **options) -> Dict:
+    """
+    Render `trajectory` (frames, N, 2 or more) to a video or to PNG files.
+    Args:
+        output: a video file (e.g. 'movie.mp4', encoded by ffmpeg), or a
+            printf pattern of PNG files (e.g. 'frames/frame_%05d.png').
+        workers: number of rendering processes (default: all cores).
+        chunk: frames rendered by one task.
+        ffmpeg: the ffmpeg executable; ffmpeg_args: its output options
+            (default: H.264 in yuv420p).
+        options: passed to FrameRenderer (size, dpi, xlim, ylim).
+    Returns:
+        dict: 'frames', 'elapsed' (seconds), and 'fps' (frames rendered per second).
+    """
+    trajectory = np.asarray(trajectory, dtype=np.float32)
+    frames = len(trajectory)
+    ranges = [(start, min(start + chunk, frames)) for start in range(0, frames, chunk)]
+    png = output.endswith(".png")
+    if png and "%" not in output:
+        raise ValueError("A PNG output must be a pattern, e.g. 'frame_%05d.png'.")
+    if not png and shutil.which(ffmpeg) is None:
+        raise FileNotFoundError(f"{ffmpeg} not found; install it, or export PNG files.")
+
+    workers = workers or os.cpu_count()
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(trajectory, options)) as pool:
+        if png:
+            list(pool.map(_render_png, *zip(*ranges), it.repeat(output)))
+        else:
+            # The size of the frames is known only after the figure is laid out
+            width, height = FrameRenderer(trajectory[:1], **options).canvas.get_width_height()
+            cmd = [ffmpeg, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps),
+                   "-i", "-"]
+            cmd += ffmpeg_args if ffmpeg_args is not None else ["-c:v", "libx264", "-pix_fmt", "yuv420p"]
+            cmd.append(output)
+            # At most 2*workers chunks are rendered ahead of ffmpeg: the next one
+            # is submitted after the oldest is written, so a slow encoder does
+            # not pile up frames in memory. The first ones start the workers,
+            # which are forked before the pipe is opened and do not hold it open.
+            tasks = iter(ranges)
+            pending = deque(pool.submit(_render_rgb, *task) for task in it.islice(tasks, 2 * workers))
+            encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            try:
+                while pending:
+                    encoder.stdin.write(pending.popleft().result())
+                    for task in it.islice(tasks, 1):
+                        pending.append(pool.submit(_render_rgb, *task))
+            finally:
+                for future in pending:
+                    future.cancel()
+                encoder.stdin.close()
+                if encoder.wait() != 0:
+                    raise RuntimeError(f"{ffmpeg} failed with code {encoder.returncode}")
+    elapsed = time.perf_counter() - t0
+    return {"frames": frames, "elapsed": elapsed, "fps": frames / elapsed}
+
+
+# ==========================================
+# run as: python3 -m exporter [output]
+# ==========================================
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    from sys import argv
+
+    import cprototype as cp
+    from ccompiler import CSharedLibraryCompiler
+
+    output = argv[1] if len(argv) > 1 else "harmonic.mp4"
+    NUMBER_OF_PARTICLES = 12
+    bench = Path(__file__).resolve().parent.parent / "bench" / "harmonic.c"
+    path = CSharedLibraryCompiler(bench, output_dir=tempfile.gettempdir()).compile(cached=True)
+    solver = cp.EOMSolver(path, NUMBER_OF_PARTICLES, 2, derivative="harmonic_2D")
+    angles = 2 * np.pi * np.arange(NUMBER_OF_PARTICLES) / NUMBER_OF_PARTICLES
+    positions = np.stack([2 * np.cos(angles), np.sin(angles)], axis=1).astype(np.float32)
+    velocities = np.zeros_like(positions)
+
+    trajectory = record(solver, positions, velocities, dt=0.05, frames=600)
+    result = export(trajectory, output)
+    print(f"{result['frames']} frames in {result['elapsed']:.2f} s ({result['fps']:.0f} frames/s)")
@@ -1,8 +1,43 @@
-from typing import List
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+# SymPy is imported lazily, inside the functions that use it,
+# so importing this module does not cost seconds of startup time.
+if TYPE_CHECKING:
+    import sympy as sp
+
+
+def _euler_lagrange_row(L: sp.Expr, q: List[sp.Expr], i: int) -> Tuple[List[sp.Expr], sp.Expr]:
+    """
+    Form the i-th Euler-Lagrange equation and split it into M * q_ddot = F.
+
+    Runs in a worker process, hence a module-level function.
+    Returns:
+        tuple: (i-th row of the mass matrix M, i-th forcing term F).
+    """
+    from sympy.physics.mechanics import dynamicsymbols
+
+    t = dynamicsymbols._t
+    qd = [q_j.diff(t) for q_j in q]
+    qdd = [q_j.diff(t, 2) for q_j in q]
+
+    # d/dt (dL / d(q_dot_i)) - dL / d(q_i) = 0
+    eq = L.diff(qd[i]).diff(t) - L.diff(q[i])
+
+    # The equation is linear in the accelerations: M_ij = d(eq)/d(q_ddot_j)
+    row = [eq.diff(qdd_j) for qdd_j in qdd]
+    forcing = -eq.subs({qdd_j: 0 for qdd_j in qdd})
+    return row, forcing
+
+
+def _print_c(expr: sp.Expr) -> str:
+    """Print a single expression as C code (worker process helper)."""
+    from sympy.printing.c import ccode
+    return ccode(expr)
 
-import sympy as sp
-from sympy.physics.mechanics import LagrangesMethod, dynamicsymbols
-from sympy.printing.c import ccode
 
 class LagrangianToC:
     vectorType: str = "float"
@@ -19,10 +54,35 @@ class LagrangianToC:
         self.q = q
         # We don't need to pass velocities explicitly; LagrangesMethod infers q_dot
 
-    def generate_c_function(self, func_name="equations_of_motion", collapse_constants: bool=True) -> str:
+    def generate_c_function(self, func_name="equations_of_motion", collapse_constants: bool=True,
+                            processes: Optional[int]=None, mass_matrix: Optional[str]=None) -> str:
         """
         Generates a C function string that computes accelerations.
+
+        Args:
+            func_name (str): Name of the generated C function.
+            collapse_constants (bool): Declare constants in the body instead of the signature.
+            processes (int, optional): If given, the Euler-Lagrange equations are formed
+                (and printed to C) in parallel by a pool of that many processes.
+            mass_matrix (str, optional): How M * q_ddot = F is solved:
+                'symbolic' - M is inverted by SymPy (LM.rhs()), the default for serial runs,
+                'lu'       - M and F are emitted separately and solved in C on every call
+                             with a dense LU decomposition, the default if `processes` is given,
+                'cholesky' - as 'lu', but with an unrolled Cholesky decomposition
+                             (M is symmetric positive definite for T quadratic in q_dot).
+                The runtime modes keep the generated code polynomial in size,
+                which compiles and runs much faster for three or more coordinates.
         """
+        if mass_matrix is None:
+            mass_matrix = "symbolic" if processes is None else "lu"
+        if mass_matrix not in ("symbolic", "lu", "cholesky"):
+            raise ValueError("mass_matrix must be 'symbolic', 'lu', or 'cholesky'.")
+        if mass_matrix != "symbolic":
+            return self._generate_mass_matrix_function(func_name, collapse_constants, processes, mass_matrix)
+
+        from sympy.physics.mechanics import LagrangesMethod
+        from sympy.printing.c import ccode
+
         # 1. Initialize LagrangesMethod
         # This automatically computes d/dt(dL/dqdot) - dL/dq = Forces
         LM = LagrangesMethod(self.L, self.q)
@@ -41,34 +101,216 @@ class LagrangianToC:
         accel_exprs = full_rhs[n:, 0]
 
         # 4. Identify Constants
-        # Get all free symbols from the expressions
-        # We use the derived expressions to ensure we catch everything needed
+        # Identify dynamic symbols (q, u, t) to exclude them from the constants list
+        # LM.q contains coordinates, LM.u contains speeds (velocities)
+        constants = self._constants(accel_exprs, LM.q, LM.u)
+
+        # 5. Create Symbol Mapping for C-Array access
+        subs_map = self._subs_map(LM.q, LM.u)
+
+        # 6. Construct the C Function
+        lines = self._header(func_name, constants, collapse_constants)
+        for i, expr in enumerate(accel_exprs):
+            # Apply the substitution mapping
+            mapped_expr = expr.subs(subs_map)
+
+            # Generate C code
+            c_str = ccode(mapped_expr)
+            lines.append(f"    _dq[{i}] = dq[{i}];")
+            lines.append(f"    _ddq[{i}] = {c_str};")
+
+        lines.append("return;")
+        lines.append("}")
+
+        return "\n".join(lines)
+
+    def generate_event_function(self, func_name: str, conditions: List[sp.Expr]) -> str:
+        """
+        Generates a C event function for EOMSolver.set_events.
+
+        Args:
+            func_name (str): Name of the generated C function.
+            conditions (list): Expressions g_k(q, q_dot, t); event k happens
+                when g_k changes sign, e.g. [theta - theta_max] for a limit stop.
+                Constants are declared in the body, as with collapse_constants.
+        """
+        import sympy as sp
+        from sympy.physics.mechanics import dynamicsymbols
+        from sympy.printing.c import ccode
+
+        t = dynamicsymbols._t
+        qd = [q_i.diff(t) for q_i in self.q]
+        # Velocities first, so q_i.diff(t) is not rewritten as q[i].diff(t)
+        subs_map = {qd_i: sp.Symbol(f"dq[{i}]") for i, qd_i in enumerate(qd)}
+        subs_map.update({q_i: sp.Symbol(f"q[{i}]") for i, q_i in enumerate(self.q)})
+        subs_map[t] = sp.Symbol("t")
+        constants = self._constants(conditions, self.q, qd)
+
+        lines = [f"void {func_name}({self.vectorType}* q, {self.vectorType}* dq, float t, float* _g, size_t N) {{",
+                 "    // Auto-generated event conditions: an event happens when _g[k] changes sign"]
+        lines += self._constant_lines(constants)
+        for k, condition in enumerate(conditions):
+            mapped_expr = sp.sympify(condition).subs(subs_map, simultaneous=True)
+            lines.append(f"    _g[{k}] = {ccode(mapped_expr)};")
+        lines.append("return;")
+        lines.append("}")
+
+        return "\n".join(lines)
+
+    def _generate_mass_matrix_function(self, func_name: str, collapse_constants: bool,
+                                       processes: Optional[int], mass_matrix: str) -> str:
+        """
+        Generates a C function that assembles M and F and solves M * q_ddot = F
+        at runtime with the decomposition selected by `mass_matrix`.
+        If `processes` is given, each Euler-Lagrange equation, and each
+        C expression, is handled by a separate task of a process pool.
+        """
+        import sympy as sp
+        from sympy.physics.mechanics import dynamicsymbols
+
+        n = len(self.q)
+        t = dynamicsymbols._t
+        qd = [q_i.diff(t) for q_i in self.q]
+        # Cholesky only reads the lower triangle of the (symmetric) mass matrix
+        entries = [(i, j) for i in range(n) for j in range(n)
+                   if mass_matrix != "cholesky" or j <= i]
+
+        with (ProcessPoolExecutor(max_workers=processes) if processes is not None else nullcontext()) as pool:
+            def _map(func, *iterables):
+                if pool is None:
+                    return list(map(func, *iterables))
+                chunksize = max(1, len(iterables[0]) // (4 * (processes or 1)))
+                return list(pool.map(func, *iterables, chunksize=chunksize))
+
+            # 1. Form the equations, one task per coordinate
+            rows = _map(_euler_lagrange_row, [self.L] * n, [self.q] * n, list(range(n)))
+            forcing = [f for _, f in rows]
+
+            # 2. Identify Constants and map q, q_dot onto the C arrays
+            all_exprs = [rows[i][0][j] for i, j in entries] + forcing
+            constants = self._constants(all_exprs, self.q, qd)
+            subs_map = self._subs_map(self.q, qd)
+
+            # 3. Eliminate common subexpressions shared by M and F
+            replacements, reduced = sp.cse([e.subs(subs_map) for e in all_exprs],
+                                           symbols=sp.numbered_symbols("_x"))
+
+            # 4. Print C code in parallel
+            c_strs = _map(_print_c, [e for _, e in replacements] + reduced)
+
+        # 5. Construct the C Function
+        lines = self._header(func_name, constants, collapse_constants)
+        for (sym, _), c_str in zip(replacements, c_strs):
+            lines.append(f"    const {self.vectorType} {sym} = {c_str};")
+        c_strs = c_strs[len(replacements):]
+        lines.append(f"    {self.vectorType} _M[{n}][{n}];")
+        for (i, j), c_str in zip(entries, c_strs):
+            lines.append(f"    _M[{i}][{j}] = {c_str};")
+        for i, c_str in enumerate(c_strs[len(entries):]):
+            lines.append(f"    _dq[{i}] = dq[{i}];")
+            lines.append(f"    _ddq[{i}] = {c_str};")
+        if mass_matrix == "cholesky":
+            lines.extend(self._cholesky_solve_lines(n))
+        else:
+            lines.append(f"    const size_t _n = {n};")
+            lines.extend(self._lu_solve_lines())
+
+        lines.append("return;")
+        lines.append("}")
+
+        return "\n".join(lines)
+
+    def _cholesky_solve_lines(self, n: int) -> List[str]:
+        """
+        Unrolled C code solving M * _ddq = F in place (F is stored in _ddq).
+        M = L * L^T is factorised into the lower triangle of _M,
+        followed by forward and backward substitution.
+        """
+        lines = ["    // Solve M * _ddq = F at runtime (unrolled Cholesky, L stored in the lower triangle of _M)"]
+        for j in range(n):
+            diag = "".join(f" - _M[{j}][{k}]*_M[{j}][{k}]" for k in range(j))
+            lines.append(f"    _M[{j}][{j}] = sqrt(_M[{j}][{j}]{diag});")
+            for i in range(j + 1, n):
+                off = "".join(f" - _M[{i}][{k}]*_M[{j}][{k}]" for k in range(j))
+                lines.append(f"    _M[{i}][{j}] = (_M[{i}][{j}]{off}) / _M[{j}][{j}];")
+        # L * y = F
+        for i in range(n):
+            terms = "".join(f" - _M[{i}][{k}]*_ddq[{k}]" for k in range(i))
+            lines.append(f"    _ddq[{i}] = (_ddq[{i}]{terms}) / _M[{i}][{i}];")
+        # L^T * q_ddot = y
+        for i in reversed(range(n)):
+            terms = "".join(f" - _M[{k}][{i}]*_ddq[{k}]" for k in range(i + 1, n))
+            lines.append(f"    _ddq[{i}] = (_ddq[{i}]{terms}) / _M[{i}][{i}];")
+        return lines
+
+    def _lu_solve_lines(self) -> List[str]:
+        """
+        C code solving M * _ddq = F in place (F is stored in _ddq) by
+        Gaussian elimination with partial pivoting.
+        Local names are prefixed with '_' so they cannot clash with constants.
+        """
+        vt = self.vectorType
+        return [
+            "    // Solve M * _ddq = F at runtime (LU with partial pivoting)",
+            "    for (size_t _k = 0; _k < _n; ++_k) {",
+            "        size_t _p = _k;",
+            "        for (size_t _r = _k + 1; _r < _n; ++_r)",
+            "            if (fabs(_M[_r][_k]) > fabs(_M[_p][_k])) _p = _r;",
+            "        if (_p != _k) {",
+            f"            for (size_t _c = 0; _c < _n; ++_c) {{ {vt} _s = _M[_k][_c]; _M[_k][_c] = _M[_p][_c]; _M[_p][_c] = _s; }}",
+            f"            {vt} _s = _ddq[_k]; _ddq[_k] = _ddq[_p]; _ddq[_p] = _s;",
+            "        }",
+            "        for (size_t _r = _k + 1; _r < _n; ++_r) {",
+            f"            {vt} _l = _M[_r][_k] / _M[_k][_k];",
+            "            for (size_t _c = _k; _c < _n; ++_c) _M[_r][_c] -= _l * _M[_k][_c];",
+            "            _ddq[_r] -= _l * _ddq[_k];",
+            "        }",
+            "    }",
+            "    for (size_t _k = _n; _k-- > 0;) {",
+            "        for (size_t _c = _k + 1; _c < _n; ++_c) _ddq[_k] -= _M[_k][_c] * _ddq[_c];",
+            "        _ddq[_k] /= _M[_k][_k];",
+            "    }",
+        ]
+
+    def _constants(self, exprs, q, u) -> List[sp.Symbol]:
+        """
+        Get all free symbols from the expressions, except the dynamic ones (q, u, t).
+        We use the derived expressions to ensure we catch everything needed
+        """
+        from sympy.physics.mechanics import dynamicsymbols
+
         all_free = set()
-        for expr in accel_exprs:
+        for expr in exprs:
             all_free.update(expr.free_symbols)
 
-        # Identify dynamic symbols (q, u, t) to exclude them from the constants list
-        # LM.q contains coordinates, LM.u contains speeds (velocities)
-        dynamic_vars = set(LM.q) | set(LM.u) | {dynamicsymbols._t}
+        dynamic_vars = set(q) | set(u) | {dynamicsymbols._t}
 
-        constants = sorted([s for s in all_free if s not in dynamic_vars], key=lambda x: x.name)
+        return sorted([s for s in all_free if s not in dynamic_vars], key=lambda x: x.name)
 
-        # 5. Create Symbol Mapping for C-Array access
-        # We substitute the sympy symbols with explicit C-string formatted symbols
-        # e.g. theta(t) -> q[0], u_0 -> dq[0]
+    def _subs_map(self, q, u) -> dict:
+        """
+        We substitute the sympy symbols with explicit C-string formatted symbols
+        e.g. theta(t) -> q[0], u_0 -> dq[0]
+        """
+        import sympy as sp
 
         subs_map = {}
 
         # Map coordinates q_i -> q[i]
-        for i, q_sym in enumerate(LM.q):
+        for i, q_sym in enumerate(q):
             # We create a dummy symbol named "q[i]" so ccode prints it exactly so
             subs_map[q_sym] = sp.Symbol(f"q[{i}]")
 
         # Map speeds u_i -> dq[i]
-        for i, u_sym in enumerate(LM.u):
+        for i, u_sym in enumerate(u):
             subs_map[u_sym] = sp.Symbol(f"dq[{i}]")
 
-        # 6. Construct the C Function
+        return subs_map
+
+    def _header(self, func_name: str, constants: List[sp.Symbol], collapse_constants: bool) -> List[str]:
+        """
+        Function signature and the constants' declarations.
+        """
         lines = []
 
         # Function Signature
@@ -81,22 +323,17 @@ class LagrangianToC:
         lines.append("    // Auto-generated Euler-Lagrange Equations using sympy.physics.mechanics")
 
         if collapse_constants:
-            lines.append("    // Constants have been collapsed into their values.")
-            for i,c in enumerate(constants):
-                lines.append(f"    float {c.name} = {i}.0{i+1} /* assign proper {c.name} value here */;")
-        for i, expr in enumerate(accel_exprs):
-            # Apply the substitution mapping
-            mapped_expr = expr.subs(subs_map)
-
-            # Generate C code
-            c_str = ccode(mapped_expr)
-            lines.append(f"    _dq[{i}] = dq[{i}];")
-            lines.append(f"    _ddq[{i}] = {c_str};")
-
-        lines.append("return;")
-        lines.append("}")
+            lines += self._constant_lines(constants)
+        return lines
 
-        return "\n".join(lines)
+    def _constant_lines(self, constants: List[sp.Symbol]) -> List[str]:
+        """
+        Declarations of the collapsed constants, with placeholder values.
+        """
+        lines = ["    // Constants have been collapsed into their values."]
+        for i,c in enumerate(constants):
+            lines.append(f"    float {c.name} = {i}.0{i+1} /* assign proper {c.name} value here */;")
+        return lines
 
 # ==========================================
 #                                                                        
@@ -113,6 +350,8 @@ class LagrangianToC:
 # ==========================================
 
 if __name__ == "__main__":
+    import sympy as sp
+    from sympy.physics.mechanics import dynamicsymbols
 
     # --- Example 1: Simple Pendulum ---
     print("--- Generating Code for Simple Pendulum ---")
@@ -138,6 +377,11 @@ if __name__ == "__main__":
     print(gen.generate_c_function("pendulum_step"))
     print("\n")
 
+    # Limit stops at +-theta_max, see EOMSolver.set_events
+    theta_max = sp.symbols('theta_max')
+    print(gen.generate_event_function("pendulum_stops", [theta - theta_max, theta + theta_max]))
+    print("\n")
+
     # --- Example 2: Double Pendulum (Demonstrating Matrix Solving Capability) ---
     print("--- Generating Code for Double Pendulum ---")
 
@@ -171,3 +415,8 @@ if __name__ == "__main__":
 
     gen2 = LagrangianToC(L_dp, [q1, q2])
     print(gen2.generate_c_function("double_pendulum_step",collapse_constants=False))
+    print("\n")
+
+    # --- Example 3: Double Pendulum, parallel derivation and runtime solve of M * q_ddot = F ---
+    print("--- Generating Code for Double Pendulum (mass matrix solved in C) ---")
+    print(gen2.generate_c_function("double_pendulum_step_lu", collapse_constants=False, processes=2))
@@ -11,6 +11,8 @@ import animation as anim
 from ccompiler import CSharedLibraryCompiler
 
 # === CONSTANTS ===
+PROFILE = "--profile" in argv # Time the simulation phases and report them at exit
+argv = [arg for arg in argv if arg != "--profile"]
 if len(argv) > 1:
     try:
         NUMBER_OF_PARTICLES = int(argv[1]) # Number of particles read from command line
@@ -28,7 +30,9 @@ dt                  = 0.01   # Timestep for the simulation
 # This assumes 'libsolver.so' is in a 'solve' directory one level *up*
 # from the directory containing this Python script.
 ccompiler = CSharedLibraryCompiler(source_file="../solver/solver.c")
-__solver_path = ccompiler.compile()
+if PROFILE:
+    ccompiler.flags.append("-DSOLVER_PROFILE")
+__solver_path = ccompiler.compile(cached=True) # gcc runs only if solver.c changed
 _libsolver    = cp.EOMSolver(__solver_path, NUMBER_OF_PARTICLES, DIMENSIONS=2)
 
 # +== INITIAL CONDITIONS ===
@@ -44,7 +48,11 @@ ani = anim.Animation2D(vector_factory=_libsolver.vector,
                        positions=positions,
                        velocities=velocities,
                        dt=dt,
-                       NUMBER_OF_PARTICLES=NUMBER_OF_PARTICLES)
+                       NUMBER_OF_PARTICLES=NUMBER_OF_PARTICLES,
+                       profile=PROFILE)
+if PROFILE:
+    ani.timer.add_source("libsolver", _libsolver.stats)
+    ani.timer.print_at_exit()
 ani.create_canvas()
 
 # === RUN ANIMATION ===
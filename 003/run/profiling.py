@@ -0,0 +1,85 @@
+"""
+Lightweight wall-clock timers for the phases of a simulation loop.
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import atexit
+from collections import defaultdict
+from time import perf_counter
+from typing import Callable, Dict
+
+
+class PhaseTimer:
+    """
+    Accumulates wall time and call counts per named phase.
+    When disabled, `start()` and `lap()` return immediately.
+
+    Usage:
+        t = timer.start()
+        ...
+        t = timer.lap("phase 1", t)
+        ...
+        t = timer.lap("phase 2", t)
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.sources = {}
+
+    def start(self) -> float:
+        return perf_counter() if self.enabled else 0.0
+
+    def lap(self, phase: str, start: float) -> float:
+        """
+        Add the time elapsed since `start` to `phase`.
+        Returns the current time, so consecutive phases can be chained.
+        """
+        if not self.enabled:
+            return 0.0
+        now = perf_counter()
+        self.totals[phase] += now - start
+        self.calls[phase] += 1
+        return now
+
+    def add_source(self, name: str, source: Callable[[], Dict]) -> None:
+        """
+        Register an additional source of statistics (e.g. EOMSolver.stats),
+        included in `as_dict()` and `report()`.
+        """
+        self.sources[name] = source
+
+    def reset(self) -> None:
+        self.totals.clear()
+        self.calls.clear()
+
+    def as_dict(self) -> Dict:
+        phases = {phase: {"total": total,
+                          "calls": self.calls[phase],
+                          "mean": total / self.calls[phase]}
+                  for phase, total in self.totals.items()}
+        result = {"phases": phases}
+        for name, source in self.sources.items():
+            result[name] = source()
+        return result
+
+    def report(self) -> str:
+        """
+        Human readable summary of `as_dict()`.
+        """
+        summary = self.as_dict()
+        grand_total = sum(p["total"] for p in summary["phases"].values()) or 1.0
+        lines = [f"{'phase':<20} {'calls':>10} {'total [s]':>12} {'mean [s]':>12} {'share':>7}"]
+        for phase, p in summary["phases"].items():
+            lines.append(f"{phase:<20} {p['calls']:>10d} {p['total']:>12.6f} "
+                         f"{p['mean']:>12.3e} {100 * p['total'] / grand_total:>6.1f}%")
+        for name in self.sources:
+            lines.append(f"--- {name} ---")
+            for key, value in summary[name].items():
+                lines.append(f"{key:<20} {value}")
+        return "\n".join(lines)
+
+    def print_at_exit(self) -> None:
+        atexit.register(lambda: print(self.report()))
@@ -0,0 +1,268 @@
+"""
+Simulation server streaming the state of an EOMSolver to remote viewers.
+
+The server advances the simulation continuously (in C, outside the GIL)
+and sends snapshots to the subscribed clients over TCP or a Unix socket.
+A snapshot is a header `<QdII` (step, time, N, D) followed by the
+N*D float32 positions. On connecting, a client sends its maximal rate
+as `<f` frames per second (0 for no limit). Every client gets only the
+latest snapshot when it is ready for one: if it is slow, or its socket
+is full, the snapshots in between are dropped instead of queued.
+
+SnapshotClient receives the snapshots; its `next_step` has the signature
+of EOMSolver.next_step, so Animation2D renders a remote simulation with
+`Animation2D(next_step=client.next_step, ...)`.
+"""
+
+# === IMPORTS ===
+# Standard library imports
+import asyncio
+import contextlib
+import ctypes
+import socket
+import struct
+import time
+from typing import Dict, Optional
+
+# Numpy (https://numpy.org/)
+import numpy as np
+
+# === PROTOCOL ===
+HEADER = struct.Struct("<QdII")   # step, time, N, D
+SUBSCRIBE = struct.Struct("<f")   # maximal frames per second of a client (0: no limit)
+
+
+class SimulationServer:
+    def __init__(self, solver, positions: np.ndarray, velocities: np.ndarray, dt: float,
+                 steps_per_frame: int = 1, t: float = 0.0, frame_rate: Optional[float] = None):
+        """
+        Args:
+            solver: an EOMSolver with a `derivative` (see EOMSolver.advance).
+            positions, velocities: initial state, N*D float32 values.
+            dt: time step.
+            steps_per_frame: steps advanced between two snapshots.
+            frame_rate: snapshots per second at most (None: as fast as possible).
+        """
+        self.solver = solver
+        self.positions = np.array(positions, dtype=np.float32).reshape(
+            solver.NUMBER_OF_PARTICLES, solver.DIMENSIONS)
+        self.velocities = np.array(velocities, dtype=np.float32).reshape(self.positions.shape)
+        self.dt = dt
+        self.steps_per_frame = steps_per_frame
+        self.frame_rate = frame_rate
+        self.step = 0
+        self.time = t
+        self.frame_id = 0      # number of the latest snapshot
+        self.sent = 0          # snapshots sent to all clients
+        self.dropped = 0       # snapshots skipped for slow clients
+        self.clients = 0
+        self._frame = self.snapshot()
+        self._new_frame = None # asyncio.Condition, created in the event loop
+        self._finished = False
+        self._server = None
+
+    def snapshot(self) -> bytes:
+        """
+        The current state in the wire format.
+        """
+        N, D = self.positions.shape
+        return HEADER.pack(self.step, self.time, N, D) + self.positions.tobytes()
+
+    async def simulate(self, frames: Optional[int] = None) -> None:
+        """
+        Advance the simulation and publish a snapshot every `steps_per_frame`
+        steps, `frames` times (forever if None).
+        """
+        loop = asyncio.get_running_loop()
+        frame = 0
+        next_frame = time.perf_counter()
+        while frames is None or frame < frames:
+            if self.frame_rate:
+                next_frame += 1.0 / self.frame_rate
+                await asyncio.sleep(max(0.0, next_frame - time.perf_counter()))
+            # ctypes releases the GIL, so clients are served meanwhile
+            self.time = await loop.run_in_executor(
+                None, self.solver.advance, self.positions, self.velocities,
+                self.dt, self.steps_per_frame, self.time)
+            self.step += self.steps_per_frame
+            frame += 1
+            async with self._new_frame:
+                self._frame = self.snapshot()
+                self.frame_id += 1
+                self._new_frame.notify_all()
+
+    async def _watch_client(self, reader: asyncio.StreamReader, disconnected: asyncio.Event) -> None:
+        """
+        Read (and ignore) what a subscribed client sends until it disconnects,
+        then wake its handler waiting for a new frame.
+        """
+        try:
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        disconnected.set()
+        async with self._new_frame:
+            self._new_frame.notify_all()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Send the latest snapshots to one client, at most at its rate.
+        """
+        # Keep little data in flight, so a slow client drops frames early
+        writer.transport.set_write_buffer_limits(high=4 * len(self._frame))
+        self.clients += 1
+        watcher = None
+        try:
+            rate, = SUBSCRIBE.unpack(await reader.readexactly(SUBSCRIBE.size))
+            interval = 1.0 / rate if rate > 0 else 0.0
+            # A client disconnecting between frames is noticed at once, not at the next write
+            disconnected = asyncio.Event()
+            watcher = asyncio.create_task(self._watch_client(reader, disconnected))
+            last_id, last_sent = -1, 0.0
+            while True:
+                delay = last_sent + interval - time.perf_counter()
+                if delay > 0:
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(disconnected.wait(), delay)
+                async with self._new_frame:
+                    await self._new_frame.wait_for(
+                        lambda: self.frame_id > last_id or self._finished or disconnected.is_set())
+                    frame, frame_id = self._frame, self.frame_id
+                if disconnected.is_set() or frame_id == last_id: # gone, or finished and the last frame was sent
+                    break
+                if last_id >= 0:
+                    self.dropped += frame_id - last_id - 1
+                last_id, last_sent = frame_id, time.perf_counter()
+                writer.write(frame)
+                await writer.drain()
+                self.sent += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            self.clients -= 1
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0, path: Optional[str] = None):
+        """
+        Listen on TCP `host`:`port` (0 picks a free port), or on the Unix socket `path`.
+        Returns:
+            The address clients should connect to: (host, port) or path.
+        """
+        self._new_frame = asyncio.Condition()
+        self._finished = False
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle_client, path=path)
+            return path
+        self._server = await asyncio.start_server(self._handle_client, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 0, path: Optional[str] = None,
+                    frames: Optional[int] = None) -> None:
+        """
+        Start the server and run the simulation for `frames` snapshots (forever if None).
+        """
+        address = await self.start(host, port, path)
+        print(f"[Server] Streaming on {address}")
+        try:
+            await self.simulate(frames)
+        finally:
+            async with self._new_frame:
+                self._finished = True
+                self._new_frame.notify_all()
+            self._server.close()
+            await self._server.wait_closed()
+
+    def stats(self) -> Dict:
+        return {"frames": self.frame_id, "sent": self.sent,
+                "dropped": self.dropped, "clients": self.clients}
+
+
+class SnapshotClient:
+    def __init__(self, host: str = "127.0.0.1", port: Optional[int] = None,
+                 path: Optional[str] = None, rate: float = 0.0):
+        """
+        Connect to a SimulationServer over TCP (`host`, `port`) or a Unix socket (`path`),
+        asking for at most `rate` snapshots per second (0 for no limit).
+        """
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        elif port is not None:
+            self.socket = socket.create_connection((host, port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            raise ValueError("Either port or path must be given.")
+        self.socket.sendall(SUBSCRIBE.pack(rate))
+
+    def _read(self, size: int) -> bytearray:
+        data = bytearray(size)
+        view = memoryview(data)
+        while view:
+            n = self.socket.recv_into(view)
+            if n == 0:
+                raise ConnectionError("The server closed the connection.")
+            view = view[n:]
+        return data
+
+    def receive(self) -> Dict:
+        """
+        Wait for the next snapshot.
+        Returns:
+            dict: 'step', 'time', and 'positions' (float32 array of shape (N, D)).
+        """
+        step, t, N, D = HEADER.unpack(self._read(HEADER.size))
+        positions = np.frombuffer(self._read(4 * N * D), dtype=np.float32).reshape(N, D)
+        return {"step": step, "time": t, "positions": positions}
+
+    def next_step(self, coord, vel, new_coord, new_vel, dt, N):
+        """
+        Drop-in replacement of EOMSolver.next_step for Animation2D:
+        the new positions are those of the next snapshot, `dt` is ignored.
+        """
+        positions = self.receive()["positions"]
+        ctypes.memmove(new_coord, positions.ctypes.data, min(positions.nbytes, ctypes.sizeof(new_coord)))
+        ctypes.memmove(new_vel, vel, ctypes.sizeof(new_vel))
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+# ==========================================
+# run as: python3 -m server            (server, harmonic oscillators)
+#         python3 -m server PORT       (viewer)
+# ==========================================
+
+if __name__ == "__main__":
+    from sys import argv
+
+    import cprototype as cp
+
+    NUMBER_OF_PARTICLES = 12
+    if len(argv) > 1:
+        import animation as anim
+
+        client = SnapshotClient(port=int(argv[1]), rate=30)
+        ani = anim.Animation2D(vector_factory=cp.Vector2D, c_arr=cp.Vector2D*NUMBER_OF_PARTICLES,
+                               next_step=client.next_step,
+                               positions=[cp.Vector2D() for _ in range(NUMBER_OF_PARTICLES)],
+                               velocities=[cp.Vector2D() for _ in range(NUMBER_OF_PARTICLES)],
+                               NUMBER_OF_PARTICLES=NUMBER_OF_PARTICLES)
+        ani.create_canvas()
+        ani.run_animation(frames=None)
+    else:
+        import tempfile
+        from pathlib import Path
+
+        from ccompiler import CSharedLibraryCompiler
+
+        bench = Path(__file__).resolve().parent.parent / "bench" / "harmonic.c"
+        path = CSharedLibraryCompiler(bench, output_dir=tempfile.gettempdir()).compile(cached=True)
+        solver = cp.EOMSolver(path, NUMBER_OF_PARTICLES, 2, derivative="harmonic_2D")
+        angles = 2 * np.pi * np.arange(NUMBER_OF_PARTICLES) / NUMBER_OF_PARTICLES
+        positions = np.stack([2 * np.cos(angles), np.sin(angles)], axis=1)
+        server = SimulationServer(solver, positions, np.zeros_like(positions), dt=1e-3,
+                                  steps_per_frame=10, frame_rate=100)
+        asyncio.run(server.serve(port=8765))
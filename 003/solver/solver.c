@@ -1,9 +1,66 @@
+#ifndef _POSIX_C_SOURCE
+#define _POSIX_C_SOURCE 199309L // clock_gettime
+#endif
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include <assert.h>
+#include <time.h>
+#include <math.h>
+
+/* --- Profiling ---
+ * Counters are updated only if the library is compiled with -DSOLVER_PROFILE,
+ * otherwise the PROFILE_* macros expand to nothing and cost nothing.
+ * The counters are global and not thread-safe.
+ */
+typedef struct {
+	uint64_t steps;        // calls of next_*D and RK4_*D
+	uint64_t dfdx_calls;   // evaluations of the derivative function(s)
+	double   stage[4];     // seconds spent in the RK4 stages k1..k4 (including dfdx)
+	double   combine;      // seconds spent combining the stages
+	double   total;        // seconds spent in next_*D and RK4_*D
+} SolverStats;
+
+static SolverStats solver_counters;
+
+#ifdef SOLVER_PROFILE
+static inline double solver_clock(void){
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (double)ts.tv_sec + 1e-9*(double)ts.tv_nsec;
+}
+#define PROFILE_START(name)      double name = solver_clock()
+#define PROFILE_ADD(field, name) solver_counters.field += solver_clock() - (name)
+#define PROFILE_COUNT(field, n)  solver_counters.field += (n)
+#else
+#define PROFILE_START(name)
+#define PROFILE_ADD(field, name)
+#define PROFILE_COUNT(field, n)
+#endif
+
+int solver_profiling(void){
+	/* 1 if the counters are enabled (-DSOLVER_PROFILE), 0 otherwise */
+#ifdef SOLVER_PROFILE
+	return 1;
+#else
+	return 0;
+#endif
+}
+
+SolverStats* solver_stats(void){
+	return &solver_counters;
+}
+
+void solver_stats_reset(void){
+	memset(&solver_counters, 0, sizeof(solver_counters));
+}
+
 // const float one_sixth  = 0x1.555556p-3f; // float 1/6
 // const double one_sixth = 0x1.5555555555555p-3; // double 1/6
 float RK4(float f, float x, float dt, float(*dfdx)(float,float)){
 	const float one_sixth = 0x1.555556p-3f;
+	PROFILE_COUNT(dfdx_calls, 4);
 	float k1 = dfdx(x,f);
 	float k2 = dfdx(x+0.5*dt,f+0.5*dt*k1);
 	float k3 = dfdx(x+0.5*dt,f+0.5*dt*k2);
@@ -11,83 +68,298 @@ float RK4(float f, float x, float dt, float(*dfdx)(float,float)){
 	return one_sixth*(k1+2*k2+2*k3+k4);
 }
 
-float dxdt(float t, float x){
+static inline float dxdt(float t, float x){
 	return -1e-3*x;
 }
 
-float dvdt(float t, float x){
+static inline float dvdt(float t, float x){
 	return 0.0;
 }
 
+static inline void derivatives(float t, float x, float v, float* dx, float* dv){
+	/* dxdt and dvdt of one component, both evaluated at its position `x` */
+	*dx = dxdt(t, x);
+	*dv = dvdt(t, x);
+}
 
-/* --- 1D Functions ---
-                                                                                          
-   ▄▄▄     ▄▄▄▄▄                                                                          
-  █▀██     ██▀▀▀██                                             ██                         
-    ██     ██    ██            ▄▄█████▄  ▀██  ███  ▄▄█████▄  ███████    ▄████▄   ████▄██▄ 
-    ██     ██    ██            ██▄▄▄▄ ▀   ██▄ ██   ██▄▄▄▄ ▀    ██      ██▄▄▄▄██  ██ ██ ██ 
-    ██     ██    ██             ▀▀▀▀██▄    ████▀    ▀▀▀▀██▄    ██      ██▀▀▀▀▀▀  ██ ██ ██ 
- ▄▄▄██▄▄▄  ██▄▄▄██             █▄▄▄▄▄██     ███    █▄▄▄▄▄██    ██▄▄▄   ▀██▄▄▄▄█  ██ ██ ██ 
- ▀▀▀▀▀▀▀▀  ▀▀▀▀▀                ▀▀▀▀▀▀      ██      ▀▀▀▀▀▀      ▀▀▀▀     ▀▀▀▀▀   ▀▀ ▀▀ ▀▀ 
-                                          ███                                             
-                                                                                          
+/*
+ * Fused RK4 step of a single component: position and velocity share
+ * each of the four evaluations of the derivatives (dxdt, dvdt),
+ * which are static inline, so the loops over particles can be inlined
+ * and vectorised. Returns the averaged slopes in `sx` and `sv`.
  */
-void RK4_1D(float* x, float* v, float* dx, float* dv, float t, float dt,
-	    void(*dfdx)(float*,float*,float*,float*,float,size_t), size_t N){
-	/* RK4 Implementation in 1D
-	 * x = position array
-	 * v = velocity array
-	 * dx = derivative of position array
-	 * dv = derivative of velocity array
-	 * t = current time
-	 * dt = time step
-	 * dfdx = function that computes derivatives
-	 * arguments of dfdx: (x, v, dx, dv, t, N)
-	 * N = number of elements
-	 */
+static inline void RK4_fused(float x, float v, float t, float dt, float* sx, float* sv){
+	const float one_sixth = 0x1.555556p-3f;
+	float k1x, k1v, k2x, k2v, k3x, k3v, k4x, k4v;
+	derivatives(t,          x,                v,                &k1x, &k1v);
+	derivatives(t+0.5f*dt,  x+0.5f*dt*k1x,    v+0.5f*dt*k1v,    &k2x, &k2v);
+	derivatives(t+0.5f*dt,  x+0.5f*dt*k2x,    v+0.5f*dt*k2v,    &k3x, &k3v);
+	derivatives(t+dt,       x+dt*k3x,         v+dt*k3v,         &k4x, &k4v);
+	*sx = one_sixth*(k1x+2.0f*k2x+2.0f*k3x+k4x);
+	*sv = one_sixth*(k1v+2.0f*k2v+2.0f*k3v+k4v);
+}
+
+
+/* --- Generic D-dimensional kernel ---
+ * The state of N particles in D dimensions is stored in flat arrays
+ * of N*D floats: x[i*D + d]. Arrays of Vector2D and Vector3D have exactly
+ * this layout, so the 1D, 2D, and 3D functions below are thin wrappers
+ * of the kernels with a constant D, which the compiler specialises.
+ * Generalised coordinates (e.g. from LagrangianToC) use N=1 and D=n.
+ */
+typedef void (*derivative_fn)(float*,float*,float*,float*,float,size_t);
 
-	// Temporary arrays	
+static inline void RK4_stages(float* restrict x, float* restrict v, float* restrict dx, float* restrict dv,
+			      float t, float dt, derivative_fn dfdx, size_t N, size_t D, float* restrict work){
+	/* Stages 2-4 of RK4_kernel, with k1 = f(x, v, t) already in work + 2*M and work + 3*M
+	 * (e.g. the derivative at the end of the previous step of integrate_dense_ND)
+	 */
 	const float one_sixth = 0x1.555556p-3f;
-	size_t size = N * sizeof(float);
-	float* tmp_x = malloc(size);
-	float* tmp_v = malloc(size);
+	const size_t M = N * D;
 
-	// k1, k2, k3, k4 arrays for position and velocity
-	float* k1_dx = malloc(size); float* k1_dv = malloc(size);
-	float* k2_dx = malloc(size); float* k2_dv = malloc(size);
-	float* k3_dx = malloc(size); float* k3_dv = malloc(size);
-	float* k4_dx = malloc(size); float* k4_dv = malloc(size);
+	// Temporary arrays
+	float* restrict tmp_x = work;
+	float* restrict tmp_v = work + M;
 
-	// Calculate k1, k2, k3, k4
-	dfdx(x,v,k1_dx,k1_dv,t,N);
-	for(size_t i=0U; i<N; ++i){
+	// k1, k2, k3, k4 arrays for position and velocity
+	float* restrict k1_dx = work + 2*M; float* restrict k1_dv = work + 3*M;
+	float* restrict k2_dx = work + 4*M; float* restrict k2_dv = work + 5*M;
+	float* restrict k3_dx = work + 6*M; float* restrict k3_dv = work + 7*M;
+	float* restrict k4_dx = work + 8*M; float* restrict k4_dv = work + 9*M;
+
+	// Calculate k2, k3, k4
+	PROFILE_START(t0);
+	for(size_t i=0U; i<M; ++i){
 		tmp_x[i] = x[i] + 0.5f * dt * k1_dx[i];
 		tmp_v[i] = v[i] + 0.5f * dt * k1_dv[i];
 	}
+	PROFILE_ADD(stage[0], t0);
+	PROFILE_START(t1);
 	dfdx(tmp_x,tmp_v,k2_dx,k2_dv,t+0.5f*dt,N);
-	for(size_t i=0U; i<N; ++i){
+	for(size_t i=0U; i<M; ++i){
 		tmp_x[i] = x[i] + 0.5f * dt * k2_dx[i];
 		tmp_v[i] = v[i] + 0.5f * dt * k2_dv[i];
 	}
+	PROFILE_ADD(stage[1], t1);
+	PROFILE_START(t2);
 	dfdx(tmp_x,tmp_v,k3_dx,k3_dv,t+0.5f*dt,N);
-	for(size_t i=0U; i<N; ++i){
+	for(size_t i=0U; i<M; ++i){
 		tmp_x[i] = x[i] + dt * k3_dx[i];
 		tmp_v[i] = v[i] + dt * k3_dv[i];
 	}
+	PROFILE_ADD(stage[2], t2);
+	PROFILE_START(t3);
 	dfdx(tmp_x,tmp_v,k4_dx,k4_dv,t+dt,N);
+	PROFILE_ADD(stage[3], t3);
 
 	// Combine to get final dx and dv
-	for(size_t i=0U; i<N; ++i){
+	PROFILE_START(t4);
+	for(size_t i=0U; i<M; ++i){
 		dx[i] = one_sixth * (k1_dx[i] + 2.0f * k2_dx[i] + 2.0f * k3_dx[i] + k4_dx[i]);
 		dv[i] = one_sixth * (k1_dv[i] + 2.0f * k2_dv[i] + 2.0f * k3_dv[i] + k4_dv[i]);
 	}
+	PROFILE_ADD(combine, t4);
+	PROFILE_COUNT(steps, 1);
+	PROFILE_COUNT(dfdx_calls, 3);
+	PROFILE_ADD(total, t0);
+	return;
+}
 
-	// Cleanup
-	free(tmp_x); free(tmp_v);
-	free(k1_dx); free(k1_dv);
-	free(k2_dx); free(k2_dv);
-	free(k3_dx); free(k3_dv);
-	free(k4_dx); free(k4_dv);
+static inline void RK4_kernel(float* restrict x, float* restrict v, float* restrict dx, float* restrict dv,
+			      float t, float dt, derivative_fn dfdx, size_t N, size_t D, float* restrict work){
+	/* RK4 Implementation in D dimensions
+	 * x = position array (N*D)
+	 * v = velocity array (N*D)
+	 * dx = derivative of position array (N*D)
+	 * dv = derivative of velocity array (N*D)
+	 * t = current time
+	 * dt = time step
+	 * dfdx = function that computes derivatives
+	 * arguments of dfdx: (x, v, dx, dv, t, N)
+	 * N = number of particles
+	 * D = number of dimensions
+	 * work = workspace of 10*N*D floats
+	 */
+	// Calculate k1, then k2, k3, k4
+	PROFILE_START(t0);
+	dfdx(x,v,work + 2*N*D,work + 3*N*D,t,N);
+	PROFILE_ADD(stage[0], t0);
+	PROFILE_COUNT(dfdx_calls, 1);
+	PROFILE_ADD(total, t0);
+	RK4_stages(x, v, dx, dv, t, dt, dfdx, N, D, work);
+	return;
+}
+
+static inline void RK4_alloc(float* x, float* v, float* dx, float* dv, float t, float dt,
+			     derivative_fn dfdx, size_t N, size_t D){
+	/* RK4_kernel with its own workspace */
+	float* work = malloc(10 * N * D * sizeof(float));
+	if (!work) return;
+	RK4_kernel(x, v, dx, dv, t, dt, dfdx, N, D, work);
+	free(work);
+	return;
+}
+
+static inline void next_kernel(float* restrict coord, float* restrict vel, float* restrict new_coord, float* restrict new_vel,
+			       float dt, size_t N, size_t D){
+	/* Calculating new coordinates of N*D components */
+	PROFILE_START(t0);
+	for(size_t i=0U; i<N*D; ++i){
+		float sx, sv;
+		RK4_fused(coord[i],vel[i],0.0f,dt,&sx,&sv);
+		new_coord[i] = coord[i] + dt*sx;
+		new_vel[i] = vel[i] + dt*sv;
+	}
+	PROFILE_COUNT(dfdx_calls, 4*N*D);
+	PROFILE_COUNT(steps, 1);
+	PROFILE_ADD(total, t0);
+	return;
+}
+
+void RK4_ND(float* x, float* v, float* dx, float* dv, float t, float dt,
+	    derivative_fn dfdx, size_t N, size_t D){
+	/* RK4 for N particles in D dimensions, see RK4_kernel */
+	RK4_alloc(x, v, dx, dv, t, dt, dfdx, N, D);
+	return;
+}
+
+/*
+ * Calculates the next ND coordinates and velocities
+ */
+void next_ND(float* coord, float* vel, float* new_coord, float* new_vel, float dt, size_t N, size_t D){
+	next_kernel(coord, vel, new_coord, new_vel, dt, N, D);
+	return;
+}
+
+float advance_ND(float* x, float* v, float t, float dt, derivative_fn dfdx,
+		 size_t N, size_t D, size_t steps){
+	/* Integrates `steps` RK4 steps of size `dt` in place,
+	 * reusing one workspace for all the steps.
+	 * Returns the final time.
+	 */
+	const size_t M = N * D;
+	float* work = malloc(12 * M * sizeof(float));
+	if (!work) return t;
+	float* dx = work + 10*M;
+	float* dv = work + 11*M;
+	for(size_t s=0U; s<steps; ++s){
+		RK4_kernel(x, v, dx, dv, t, dt, dfdx, N, D, work);
+		for(size_t i=0U; i<M; ++i){
+			x[i] += dt * dx[i];
+			v[i] += dt * dv[i];
+		}
+		t += dt;
+	}
+	free(work);
+	return t;
+}
+
+
+/* --- Dense output ---
+ * Between the grid points t and t + dt of a RK4 step, the state is sampled
+ * with a cubic Hermite polynomial through the states and derivatives at
+ * both ends. The derivative at the end is the first stage (k1) of the
+ * next step, so sampling costs no extra evaluations of dfdx per step
+ * (also across calls: the last one is kept in `dense`), and the grid (the trajectory) is the same as in advance_ND.
+ */
+static inline void hermite(const float* y0, const float* f0, const float* y1, const float* f1,
+			   float h, float theta, float* y, size_t M){
+	/* Cubic Hermite interpolation at y(t0 + theta*h) of M components */
+	const float t2 = theta*theta, t3 = t2*theta;
+	const float h00 = 2.0f*t3 - 3.0f*t2 + 1.0f, h10 = t3 - 2.0f*t2 + theta;
+	const float h01 = 3.0f*t2 - 2.0f*t3,       h11 = t3 - t2;
+	for(size_t i=0U; i<M; ++i)
+		y[i] = h00*y0[i] + h10*h*f0[i] + h01*y1[i] + h11*h*f1[i];
+	return;
+}
+
+static inline size_t dense_samples(const float* dense, const float* x1, const float* v1,
+				   float t0, float dt, const float* times, size_t j, size_t n_times,
+				   float* out_x, float* out_v, size_t M){
+	/* Samples times[j] <= t0 + dt of the step stored in `dense`, returns the next j */
+	const float* x0  = dense;       const float* v0  = dense + M;
+	const float* f0x = dense + 2*M; const float* f0v = dense + 3*M;
+	const float* f1x = dense + 4*M; const float* f1v = dense + 5*M;
+	for(; j<n_times && times[j] <= t0 + dt; ++j){
+		float theta = (times[j] - t0) / dt;
+		theta = theta < 0.0f ? 0.0f : (theta > 1.0f ? 1.0f : theta);
+		hermite(x0, f0x, x1, f1x, dt, theta, out_x + j*M, M);
+		hermite(v0, f0v, v1, f1v, dt, theta, out_v + j*M, M);
+	}
+	return j;
+}
+
+float integrate_dense_ND(float* x, float* v, float t, float dt, derivative_fn dfdx, size_t N, size_t D,
+			 const float* times, size_t n_times, float* out_x, float* out_v,
+			 float* dense, int history){
+	/* Integrates RK4 steps of size `dt` in place from `t` until the step
+	 * containing the last of the (ascending) `times`, and stores the states
+	 * at those times in `out_x` and `out_v` (n_times*N*D floats each).
+	 * dense = 6*N*D + 1 floats, on return the last step (x0, v0, f0, f1, t0);
+	 * with `history`, it holds the step ending at `t` of a previous call,
+	 * so times before `t` can be sampled too, and its f1 is reused as k1
+	 * of the first step (each step costs four evaluations of dfdx).
+	 * Returns the final time, or NaN if the workspace cannot be allocated.
+	 */
+	const size_t M = N * D;
+	size_t j = 0U;
+	if (history)
+		j = dense_samples(dense, x, v, dense[6*M], dt, times, j, n_times, out_x, out_v, M);
+	for(; j<n_times && times[j] <= t; ++j){
+		memcpy(out_x + j*M, x, M * sizeof(float));
+		memcpy(out_v + j*M, v, M * sizeof(float));
+	}
+	if (j == n_times) return t;
+
+	float* work = malloc(12 * M * sizeof(float));
+	if (!work) return NAN;
+	float* dx = work + 10*M;
+	float* dv = work + 11*M;
+	if (history){
+		memcpy(work + 2*M, dense + 4*M, 2*M * sizeof(float)); // k1 at t = f1 of the previous call
+		RK4_stages(x, v, dx, dv, t, dt, dfdx, N, D, work);
+	} else {
+		RK4_kernel(x, v, dx, dv, t, dt, dfdx, N, D, work);
+	}
+	while (j < n_times){
+		memcpy(dense,       x,            M * sizeof(float));
+		memcpy(dense + M,   v,            M * sizeof(float));
+		memcpy(dense + 2*M, work + 2*M, 2*M * sizeof(float)); // k1 at t
+		for(size_t i=0U; i<M; ++i){
+			x[i] += dt * dx[i];
+			v[i] += dt * dv[i];
+		}
+		float t0 = dense[6*M] = t;
+		t += dt;
+		if (times[n_times-1] <= t){
+			dfdx(x, v, dense + 4*M, dense + 5*M, t, N); // k1 of the next call's first step
+			PROFILE_COUNT(dfdx_calls, 1);
+		} else {
+			RK4_kernel(x, v, dx, dv, t, dt, dfdx, N, D, work);
+			memcpy(dense + 4*M, work + 2*M, 2*M * sizeof(float)); // k1 at t + dt
+		}
+		j = dense_samples(dense, x, v, t0, dt, times, j, n_times, out_x, out_v, M);
+	}
+	free(work);
+	return t;
+}
+
+/* --- 1D Functions ---
+                                                                                          
+   ▄▄▄     ▄▄▄▄▄                                                                          
+  █▀██     ██▀▀▀██                                             ██                         
+    ██     ██    ██            ▄▄█████▄  ▀██  ███  ▄▄█████▄  ███████    ▄████▄   ████▄██▄ 
+    ██     ██    ██            ██▄▄▄▄ ▀   ██▄ ██   ██▄▄▄▄ ▀    ██      ██▄▄▄▄██  ██ ██ ██ 
+    ██     ██    ██             ▀▀▀▀██▄    ████▀    ▀▀▀▀██▄    ██      ██▀▀▀▀▀▀  ██ ██ ██ 
+ ▄▄▄██▄▄▄  ██▄▄▄██             █▄▄▄▄▄██     ███    █▄▄▄▄▄██    ██▄▄▄   ▀██▄▄▄▄█  ██ ██ ██ 
+ ▀▀▀▀▀▀▀▀  ▀▀▀▀▀                ▀▀▀▀▀▀      ██      ▀▀▀▀▀▀      ▀▀▀▀     ▀▀▀▀▀   ▀▀ ▀▀ ▀▀ 
+                                          ███                                             
+                                                                                          
+ */
+void RK4_1D(float* x, float* v, float* dx, float* dv, float t, float dt,
+	    void(*dfdx)(float*,float*,float*,float*,float,size_t), size_t N){
+	/* RK4 Implementation in 1D, see RK4_kernel */
+	RK4_alloc(x, v, dx, dv, t, dt, dfdx, N, 1);
 	return;
 }
 
@@ -95,11 +367,7 @@ void RK4_1D(float* x, float* v, float* dx, float* dv, float t, float dt,
  * Calculates the next 1D coordinates and velocities
  */
 void next_1D(float* coord, float* vel, float* new_coord, float* new_vel, float dt, size_t N){
-	/* Calculating new coordinates */
-	for(size_t i=0U; i<N; ++i){
-		new_coord[i] = coord[i] + dt*RK4(coord[i],vel[i],dt,&dxdt);
-		new_vel[i] = vel[i] + dt*RK4(coord[i],vel[i],dt,&dvdt);
-	}
+	next_kernel(coord, vel, new_coord, new_vel, dt, N, 1);
 	return;
 }
 
@@ -120,71 +388,12 @@ typedef struct {
 	float x;
 	float y;
 } Vector2D;
+static_assert(sizeof(Vector2D) == 2*sizeof(float), "Vector2D must be a flat pair of floats");
 
 void RK4_2D(Vector2D* x, Vector2D* v, Vector2D* dx, Vector2D* dv, float t, float dt,
 	    void(*dfdx)(Vector2D*,Vector2D*,Vector2D*,Vector2D*,float,size_t), size_t N){
-	/* RK4 Implementation in 2D
-	 * x = position array
-	 * v = velocity array
-	 * dx = derivative of position array
-	 * dv = derivative of velocity array
-	 * t = current time
-	 * dt = time step
-	 * dfdx = function that computes derivatives
-	 * arguments of dfdx: (x, v, dx, dv, t, N)
-	 * N = number of elements
-	 */
-
-	// Temporary arrays
-	const float one_sixth = 0x1.555556p-3f;
-	size_t size = N * sizeof(Vector2D);
-	Vector2D* tmp_x = malloc(size);
-	Vector2D* tmp_v = malloc(size);
-
-	// k1, k2, k3, k4 arrays for position and velocity
-	Vector2D* k1_dx = malloc(size); Vector2D* k1_dv = malloc(size);
-	Vector2D* k2_dx = malloc(size); Vector2D* k2_dv = malloc(size);
-	Vector2D* k3_dx = malloc(size); Vector2D* k3_dv = malloc(size);
-	Vector2D* k4_dx = malloc(size); Vector2D* k4_dv = malloc(size);
-
-	// Calculate k1, k2, k3, k4
-	dfdx(x,v,k1_dx,k1_dv,t,N);
-	for(size_t i=0U; i<N; ++i){
-		tmp_x[i].x = x[i].x + 0.5f * dt * k1_dx[i].x;
-		tmp_x[i].y = x[i].y + 0.5f * dt * k1_dx[i].y;
-		tmp_v[i].x = v[i].x + 0.5f * dt * k1_dv[i].x;
-		tmp_v[i].y = v[i].y + 0.5f * dt * k1_dv[i].y;
-	}
-	dfdx(tmp_x,tmp_v,k2_dx,k2_dv,t+0.5f*dt,N);
-	for(size_t i=0U; i<N; ++i){
-		tmp_x[i].x = x[i].x + 0.5f * dt * k2_dx[i].x;
-		tmp_x[i].y = x[i].y + 0.5f * dt * k2_dx[i].y;
-		tmp_v[i].x = v[i].x + 0.5f * dt * k2_dv[i].x;
-		tmp_v[i].y = v[i].y + 0.5f * dt * k2_dv[i].y;
-	}
-	dfdx(tmp_x,tmp_v,k3_dx,k3_dv,t+0.5f*dt,N);
-	for(size_t i=0U; i<N; ++i){
-		tmp_x[i].x = x[i].x + dt * k3_dx[i].x;
-		tmp_x[i].y = x[i].y + dt * k3_dx[i].y;
-		tmp_v[i].x = v[i].x + dt * k3_dv[i].x;
-		tmp_v[i].y = v[i].y + dt * k3_dv[i].y;
-	}
-	dfdx(tmp_x,tmp_v,k4_dx,k4_dv,t+dt,N);
-
-	// Combine to get final dx and dv
-	for(size_t i=0U; i<N; ++i){
-		dx[i].x = one_sixth * (k1_dx[i].x + 2.0f * k2_dx[i].x + 2.0f * k3_dx[i].x + k4_dx[i].x);
-		dx[i].y = one_sixth * (k1_dx[i].y + 2.0f * k2_dx[i].y + 2.0f * k3_dx[i].y + k4_dx[i].y);
-		dv[i].x = one_sixth * (k1_dv[i].x + 2.0f * k2_dv[i].x + 2.0f * k3_dv[i].x + k4_dv[i].x);
-		dv[i].y = one_sixth * (k1_dv[i].y + 2.0f * k2_dv[i].y + 2.0f * k3_dv[i].y + k4_dv[i].y);
-	}
-
-	// Cleanup
-	free(tmp_x); free(tmp_v);
-	free(k1_dx); free(k1_dv);
-	free(k2_dx); free(k2_dv);
-	free(k3_dx); free(k3_dv);
-	free(k4_dx); free(k4_dv);
+	/* RK4 Implementation in 2D, see RK4_kernel */
+	RK4_alloc((float*)x, (float*)v, (float*)dx, (float*)dv, t, dt, (derivative_fn)dfdx, N, 2);
 	return;
 }
 
@@ -194,14 +403,7 @@ void RK4_2D(Vector2D* x, Vector2D* v, Vector2D* dx, Vector2D* dv, float t, float
  */
 
 void next_2D(Vector2D* coord, Vector2D* vel, Vector2D* new_coord, Vector2D* new_vel, float dt, size_t N){
-	/* Calculating new coordinates */
-	for(size_t i=0U; i<N; ++i){
-		new_coord[i].x = coord[i].x + dt*RK4(coord[i].x,vel[i].x,dt,&dxdt);
-		new_coord[i].y = coord[i].y + dt*RK4(coord[i].y,vel[i].y,dt,&dxdt);
-
-		new_vel[i].x = vel[i].x + dt*RK4(coord[i].x,vel[i].x,dt,&dvdt);
-		new_vel[i].y = vel[i].y + dt*RK4(coord[i].y,vel[i].y,dt,&dvdt);
-	}
+	next_kernel((float*)coord, (float*)vel, (float*)new_coord, (float*)new_vel, dt, N, 2);
 	return;
 }
 
@@ -222,99 +424,304 @@ typedef struct {
 	float y;
 	float z;
 } Vector3D;
+static_assert(sizeof(Vector3D) == 3*sizeof(float), "Vector3D must be a flat triple of floats");
 
 
 void RK4_3D(Vector3D* x, Vector3D* v, Vector3D* dx, Vector3D* dv, float t, float dt,
 	    void(*dfdx)(Vector3D*,Vector3D*,Vector3D*,Vector3D*,float,size_t), size_t N){
-	/* RK4 Implementation in 3D
-	 * x = position array
-	 * v = velocity array
-	 * dx = derivative of position array
-	 * dv = derivative of velocity array
-	 * t = current time
-	 * dt = time step
-	 * dfdx = function that computes derivatives
-	 * arguments of dfdx: (x, v, dx, dv, t, N)
-	 * N = number of elements
-	 */
+	/* RK4 Implementation in 3D, see RK4_kernel */
+	RK4_alloc((float*)x, (float*)v, (float*)dx, (float*)dv, t, dt, (derivative_fn)dfdx, N, 3);
+	return;
+}
 
-	// Temporary arrays
-	const float one_sixth = 0x1.555556p-3f;
-	size_t size = N * sizeof(Vector3D);
-	Vector3D* tmp_x = malloc(size);
-	Vector3D* tmp_v = malloc(size);
 
-	// k1, k2, k3, k4 arrays for position and velocity
-	Vector3D* k1_dx = malloc(size); Vector3D* k1_dv = malloc(size);
-	Vector3D* k2_dx = malloc(size); Vector3D* k2_dv = malloc(size);
-	Vector3D* k3_dx = malloc(size); Vector3D* k3_dv = malloc(size);
-	Vector3D* k4_dx = malloc(size); Vector3D* k4_dv = malloc(size);
+/*
+ * Calculates the next 3D coordinates and velocities
+ */
 
-	// Calculate k1, k2, k3, k4
-	dfdx(x,v,k1_dx,k1_dv,t,N);
-	for(size_t i=0U; i<N; ++i){
-		tmp_x[i].x = x[i].x + 0.5f * dt * k1_dx[i].x;
-		tmp_x[i].y = x[i].y + 0.5f * dt * k1_dx[i].y;
-		tmp_x[i].z = x[i].z + 0.5f * dt * k1_dx[i].z;
-		tmp_v[i].x = v[i].x + 0.5f * dt * k1_dv[i].x;
-		tmp_v[i].y = v[i].y + 0.5f * dt * k1_dv[i].y;
-		tmp_v[i].z = v[i].z + 0.5f * dt * k1_dv[i].z;
-	}
-	dfdx(tmp_x,tmp_v,k2_dx,k2_dv,t+0.5f*dt,N);
-	for(size_t i=0U; i<N; ++i){
-		tmp_x[i].x = x[i].x + 0.5f * dt * k2_dx[i].x;
-		tmp_x[i].y = x[i].y + 0.5f * dt * k2_dx[i].y;
-		tmp_x[i].z = x[i].z + 0.5f * dt * k2_dx[i].z;
-		tmp_v[i].x = v[i].x + 0.5f * dt * k2_dv[i].x;
-		tmp_v[i].y = v[i].y + 0.5f * dt * k2_dv[i].y;
-		tmp_v[i].z = v[i].z + 0.5f * dt * k2_dv[i].z;
+void next_3D(Vector3D* coord, Vector3D* vel, Vector3D* new_coord, Vector3D* new_vel, float dt, size_t N){
+	next_kernel((float*)coord, (float*)vel, (float*)new_coord, (float*)new_vel, dt, N, 3);
+	return;
+}
+
+/* --- Counter-based random numbers ---
+ * Philox4x32-10 (Salmon et al., "Parallel random numbers: as easy as 1, 2, 3", SC'11).
+ * Each block of 4 numbers is a pure function of (seed, stream, block index),
+ * so there is no state to share between threads: bulk generation may be split
+ * over any number of threads (OpenMP, if compiled with -fopenmp) and
+ * the result for a given seed is the same regardless of the thread count.
+ * Use a new `stream` (e.g. the step number) for every batch.
+ */
+static inline void philox4x32(uint32_t ctr[4], uint32_t key[2]){
+	const uint32_t M0 = 0xD2511F53u, M1 = 0xCD9E8D57u;
+	const uint32_t W0 = 0x9E3779B9u, W1 = 0xBB67AE85u;
+	uint32_t k0 = key[0], k1 = key[1];
+	for(int r = 0; r < 10; r++){
+		uint64_t p0 = (uint64_t)M0 * ctr[0];
+		uint64_t p1 = (uint64_t)M1 * ctr[2];
+		uint32_t c0 = (uint32_t)(p1 >> 32) ^ ctr[1] ^ k0;
+		uint32_t c2 = (uint32_t)(p0 >> 32) ^ ctr[3] ^ k1;
+		ctr[0] = c0;
+		ctr[1] = (uint32_t)p1;
+		ctr[2] = c2;
+		ctr[3] = (uint32_t)p0;
+		k0 += W0;
+		k1 += W1;
 	}
-	dfdx(tmp_x,tmp_v,k3_dx,k3_dv,t+0.5f*dt,N);
-	for(size_t i=0U; i<N; ++i){
-		tmp_x[i].x = x[i].x + dt * k3_dx[i].x;
-		tmp_x[i].y = x[i].y + dt * k3_dx[i].y;
-		tmp_x[i].z = x[i].z + dt * k3_dx[i].z;
-		tmp_v[i].x = v[i].x + dt * k3_dv[i].x;
-		tmp_v[i].y = v[i].y + dt * k3_dv[i].y;
-		tmp_v[i].z = v[i].z + dt * k3_dv[i].z;
+	return;
+}
+
+static inline void philox_uniform4(uint64_t seed, uint64_t stream, uint64_t block, float u[4]){
+	/* 4 floats uniform in (0, 1), never exactly 0 or 1 */
+	uint32_t key[2] = {(uint32_t)seed, (uint32_t)(seed >> 32)};
+	uint32_t ctr[4] = {(uint32_t)block, (uint32_t)(block >> 32),
+			   (uint32_t)stream, (uint32_t)(stream >> 32)};
+	philox4x32(ctr, key);
+	for(int j = 0; j < 4; j++)
+		u[j] = (float)(ctr[j] >> 8) * 0x1p-24f + 0x1p-25f;
+	return;
+}
+
+static inline void philox_normal4(uint64_t seed, uint64_t stream, uint64_t block, float z[4]){
+	/* 4 standard normal floats (Box-Muller) */
+	const float two_pi = 6.28318530717958647692f;
+	float u[4];
+	philox_uniform4(seed, stream, block, u);
+	for(int j = 0; j < 4; j += 2){
+		float r = sqrtf(-2.0f*logf(u[j]));
+		z[j]   = r*cosf(two_pi*u[j+1]);
+		z[j+1] = r*sinf(two_pi*u[j+1]);
 	}
-	dfdx(tmp_x,tmp_v,k4_dx,k4_dv,t+dt,N);
+	return;
+}
 
-	// Combine to get final dx and dv
-	for(size_t i=0U; i<N; ++i){
-		dx[i].x = one_sixth * (k1_dx[i].x + 2.0f * k2_dx[i].x + 2.0f * k3_dx[i].x + k4_dx[i].x);
-		dx[i].y = one_sixth * (k1_dx[i].y + 2.0f * k2_dx[i].y + 2.0f * k3_dx[i].y + k4_dx[i].y);
-		dx[i].z = one_sixth * (k1_dx[i].z + 2.0f * k2_dx[i].z + 2.0f * k3_dx[i].z + k4_dx[i].z);
-		dv[i].x = one_sixth * (k1_dv[i].x + 2.0f * k2_dv[i].x + 2.0f * k3_dv[i].x + k4_dv[i].x);
-		dv[i].y = one_sixth * (k1_dv[i].y + 2.0f * k2_dv[i].y + 2.0f * k3_dv[i].y + k4_dv[i].y);
-		dv[i].z = one_sixth * (k1_dv[i].z + 2.0f * k2_dv[i].z + 2.0f * k3_dv[i].z + k4_dv[i].z);
+void rng_uniform(float* out, size_t n, uint64_t seed, uint64_t stream){
+	/* Fills `out` with n floats uniform in (0, 1); out[i] depends only on (seed, stream, i) */
+	const size_t blocks = (n + 3) / 4;
+#ifdef _OPENMP
+	#pragma omp parallel for schedule(static)
+#endif
+	for(size_t b = 0; b < n / 4; b++)
+		philox_uniform4(seed, stream, b, out + 4*b);
+	if (blocks > n / 4){
+		float u[4];
+		philox_uniform4(seed, stream, n / 4, u);
+		memcpy(out + 4*(n / 4), u, (n % 4) * sizeof(float));
 	}
+	return;
+}
 
-	// Cleanup
-	free(tmp_x); free(tmp_v);
-	free(k1_dx); free(k1_dv);
-	free(k2_dx); free(k2_dv);
-	free(k3_dx); free(k3_dv);
-	free(k4_dx); free(k4_dv);
+void rng_normal(float* out, size_t n, uint64_t seed, uint64_t stream){
+	/* Fills `out` with n standard normal floats; out[i] depends only on (seed, stream, i) */
+	const size_t blocks = (n + 3) / 4;
+#ifdef _OPENMP
+	#pragma omp parallel for schedule(static)
+#endif
+	for(size_t b = 0; b < n / 4; b++)
+		philox_normal4(seed, stream, b, out + 4*b);
+	if (blocks > n / 4){
+		float z[4];
+		philox_normal4(seed, stream, n / 4, z);
+		memcpy(out + 4*(n / 4), z, (n % 4) * sizeof(float));
+	}
 	return;
 }
 
+/* --- Langevin dynamics ---
+ * BAOAB splitting (Leimkuhler & Matthews, Appl. Math. Res. Express 2013)
+ * of dv = a(x) dt - gamma v dt + sqrt(2 gamma kT) dW for unit masses:
+ *   B: v += dt/2 a,  A: x += dt/2 v,  O: v = c1 v + c2 sqrt(kT) xi,
+ *   A: x += dt/2 v,  B: v += dt/2 a(x),
+ * with c1 = exp(-gamma dt), c2 = sqrt(1 - c1^2), and xi standard normal.
+ * Friction `gamma` and temperature `kT` are given per particle.
+ * The acceleration `dv` of the same `dfdx` as used by RK4 is evaluated
+ * once per step (plus once per call); it should not depend on `v`.
+ * The noise of step s is the stream `stream + s`, so splitting a run
+ * into several calls gives the same trajectory.
+ */
+float langevin_ND(float* x, float* v, float t, float dt, derivative_fn dfdx,
+		  const float* gamma, const float* kT, size_t N, size_t D, size_t steps,
+		  uint64_t seed, uint64_t stream){
+	/* Integrates `steps` BAOAB steps of size `dt` in place.
+	 * Returns the final time.
+	 */
+	const size_t M = N * D;
+	const float half_dt = 0.5f * dt;
+	float* work = malloc((3 * M + 2 * N) * sizeof(float));
+	if (!work) return t;
+	float* dx = work;
+	float* a  = work + M;
+	float* xi = work + 2*M;
+	float* c1 = work + 3*M;
+	float* c2 = work + 3*M + N;
+	for(size_t i=0U; i<N; ++i){
+		c1[i] = expf(-gamma[i] * dt);
+		c2[i] = sqrtf((1.0f - c1[i] * c1[i]) * kT[i]);
+	}
 
-/*
- * Calculates the next 3D coordinates and velocities
+	dfdx(x, v, dx, a, t, N);
+	for(size_t s=0U; s<steps; ++s){
+		rng_normal(xi, M, seed, stream + s);
+		for(size_t i=0U; i<N; ++i){
+			for(size_t d=0U; d<D; ++d){
+				const size_t j = i*D + d;
+				float vj = v[j] + half_dt * a[j];            // B
+				float xj = x[j] + half_dt * vj;              // A
+				vj = c1[i] * vj + c2[i] * xi[j];             // O
+				x[j] = xj + half_dt * vj;                    // A
+				v[j] = vj;
+			}
+		}
+		t += dt;
+		dfdx(x, v, dx, a, t, N);
+		for(size_t j=0U; j<M; ++j)
+			v[j] += half_dt * a[j];                              // B
+		PROFILE_COUNT(steps, 1);
+		PROFILE_COUNT(dfdx_calls, 1);
+	}
+	free(work);
+	return t;
+}
+
+/* --- Events ---
+ * An event function g(x, v, t) fills K values g[k]; event k happens when g[k]
+ * changes sign during a step (e.g. g = x - wall, or a pendulum's limit angle).
+ * The step is interpolated with a cubic Hermite polynomial through the states
+ * and derivatives at both ends (no extra RK4 stages), the earliest root is
+ * located by the Illinois method, the state is moved to it (on the side of the
+ * step's start), recorded, and passed to `action`, which may change x and v
+ * (e.g. reflect the velocity) and returns nonzero to stop the integration.
+ * The rest of the step is then integrated from the event. If `action` left
+ * g[k] as close to zero as it was (e.g. only changed the velocity, or
+ * nothing), the state is still at the root, so a sign change of g[k] in the
+ * rest of the step is the same event and is not reported again.
  */
+typedef void (*event_fn)(float* x, float* v, float t, float* g, size_t N);
+typedef int (*event_action)(float* x, float* v, float t, size_t event, size_t N);
 
-void next_3D(Vector3D* coord, Vector3D* vel, Vector3D* new_coord, Vector3D* new_vel, float dt, size_t N){
-	/* Calculating new coordinates */
-	for(size_t i=0U; i<N; ++i){
-		new_coord[i].x = coord[i].x + dt*RK4(coord[i].x,vel[i].x,dt,&dxdt);
-		new_coord[i].y = coord[i].y + dt*RK4(coord[i].y,vel[i].y,dt,&dxdt);
-		new_coord[i].z = coord[i].z + dt*RK4(coord[i].z,vel[i].z,dt,&dxdt);
+typedef struct {
+	float  t;      // time of the event
+	size_t event;  // index k of g[k]
+	size_t step;   // number of the step in which it happened
+} EventRecord;
+
+static inline int crossed(float g0, float g1){
+	return (g0 < 0.0f && g1 >= 0.0f) || (g0 > 0.0f && g1 <= 0.0f);
+}
 
-		new_vel[i].x = vel[i].x + dt*RK4(coord[i].x,vel[i].x,dt,&dvdt);
-		new_vel[i].y = vel[i].y + dt*RK4(coord[i].y,vel[i].y,dt,&dvdt);
-		new_vel[i].z = vel[i].z + dt*RK4(coord[i].z,vel[i].z,dt,&dvdt);
+static inline float locate_root(const float* x0, const float* v0, const float* f0x, const float* f0v,
+				const float* x1, const float* v1, const float* f1x, const float* f1v,
+				float t, float h, float g0, float g1, event_fn g, size_t k,
+				float* xi, float* vi, float* gi, size_t N, size_t M){
+	/* Fraction theta of the step at which g[k] changes sign on the Hermite
+	 * interpolant (Illinois method), on the side of the step's start.
+	 */
+	const float tolerance = 1e-6f;
+	float a = 0.0f, b = 1.0f;
+	int side = 0;
+	for(int it=0; it<60 && b - a > tolerance; ++it){
+		float c = (a*g1 - b*g0) / (g1 - g0);
+		if (!(c > a && c < b)) c = 0.5f*(a + b);
+		hermite(x0, f0x, x1, f1x, h, c, xi, M);
+		hermite(v0, f0v, v1, f1v, h, c, vi, M);
+		g(xi, vi, t + c*h, gi, N);
+		if (crossed(g0, gi[k])){
+			b = c; g1 = gi[k];
+			if (side == -1) g0 *= 0.5f; // Illinois: the same end moved twice
+			side = -1;
+		} else {
+			a = c; g0 = gi[k];
+			if (side == +1) g1 *= 0.5f;
+			side = +1;
+		}
 	}
-	return;
+	return a;
 }
 
+size_t advance_events_ND(float* x, float* v, float* t, float dt, derivative_fn dfdx,
+			 event_fn g, event_action action, size_t K, size_t N, size_t D, size_t steps,
+			 EventRecord* records, size_t max_records){
+	/* Integrates `steps` RK4 steps of size `dt` in place, starting at *t.
+	 * Without an `action` all events are only recorded; with one, the state
+	 * is moved to the earliest event before calling it.
+	 * Up to `max_records` events are stored in `records`.
+	 * Returns the number of events (may exceed max_records); *t is the final time.
+	 */
+	const size_t M = N * D;
+	size_t count = 0U;
+	float* work = malloc((20 * M + 3 * K) * sizeof(float));
+	if (!work) return 0U;
+	float* dx  = work + 10*M;  float* dv  = work + 11*M;  // averaged RK4 slopes
+	float* x0  = work + 12*M;  float* v0  = work + 13*M;  // state at the step's start
+	float* f0x = work + 14*M;  float* f0v = work + 15*M;  // derivatives at the step's start
+	float* f1x = work + 16*M;  float* f1v = work + 17*M;  // derivatives at the step's end
+	float* xi  = work + 18*M;  float* vi  = work + 19*M;  // interpolated state
+	float* g0  = work + 20*M;  float* g1  = g0 + K;  float* gi = g1 + K;
+
+	g(x, v, *t, g0, N);
+	size_t skip = K; // the event just handled by `action`, not to be found again at once
+	for(size_t s=0U; s<steps; ++s){
+		float h = dt;
+		while (h > 0.0f){
+			memcpy(x0, x, M * sizeof(float));
+			memcpy(v0, v, M * sizeof(float));
+			RK4_kernel(x, v, dx, dv, *t, h, dfdx, N, D, work);
+			memcpy(f0x, work + 2*M, M * sizeof(float)); // k1 = f(t0)
+			memcpy(f0v, work + 3*M, M * sizeof(float));
+			for(size_t i=0U; i<M; ++i){
+				x[i] += h * dx[i];
+				v[i] += h * dv[i];
+			}
+			g(x, v, *t + h, g1, N);
+
+			float theta_event = 2.0f;
+			size_t event = K;
+			int derivatives_at_end = 0;
+			for(size_t k=0U; k<K; ++k){
+				if (!crossed(g0[k], g1[k])) continue;
+				if (!derivatives_at_end){
+					dfdx(x, v, f1x, f1v, *t + h, N);
+					derivatives_at_end = 1;
+				}
+				float theta = locate_root(x0, v0, f0x, f0v, x, v, f1x, f1v,
+							  *t, h, g0[k], g1[k], g, k, xi, vi, gi, N, M);
+				if (k == skip) continue;
+				if (!action){
+					if (count < max_records)
+						records[count] = (EventRecord){*t + theta*h, k, s};
+					++count;
+				} else if (theta < theta_event){
+					theta_event = theta;
+					event = k;
+				}
+			}
+			if (event == K){
+				*t += h;
+				memcpy(g0, g1, K * sizeof(float));
+				skip = K;
+				break;
+			}
+
+			/* Move to the earliest event, record it, and act */
+			hermite(x0, f0x, x, f1x, h, theta_event, xi, M);
+			hermite(v0, f0v, v, f1v, h, theta_event, vi, M);
+			memcpy(x, xi, M * sizeof(float));
+			memcpy(v, vi, M * sizeof(float));
+			*t += theta_event * h;
+			h -= theta_event * h;
+			if (count < max_records)
+				records[count] = (EventRecord){*t, event, s};
+			++count;
+			g(x, v, *t, g0, N);
+			const float g_event = fabsf(g0[event]);
+			if (action(x, v, *t, event, N)){
+				free(work);
+				return count;
+			}
+			g(x, v, *t, g0, N);
+			skip = fabsf(g0[event]) <= g_event ? event : K;
+		}
+	}
+	free(work);
+	return count;
+}